@@ -0,0 +1,243 @@
+import difflib
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from dotenv import load_dotenv
+from database import get_db, log_db_operation
+from logger_config import setup_logger
+
+# Load environment variables
+load_dotenv()
+ANALYTICS_BATCH_SIZE = int(os.getenv('ANALYTICS_BATCH_SIZE', '1000'))
+ANALYTICS_INTERVAL_S = float(os.getenv('ANALYTICS_INTERVAL_S', '60'))
+
+# Setup logger
+logger = setup_logger('analytics', 'analytics.log')
+
+CURSOR_NAME = 'conversations'
+MAX_MISTAKE_WORDS = 4  # longer rewrites are style changes, not recurring mistakes
+
+_ORIGINAL_RE = re.compile(r'^\W*Original:\s*(.+)$', re.IGNORECASE)
+_BETTER_RE = re.compile(r'^\W*Better:\s*(.+)$', re.IGNORECASE)
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def _clean(sentence: str) -> str:
+    return sentence.strip().strip('"“”\'').strip()
+
+
+def extract_corrections(text: str) -> list[tuple[str, str]]:
+    """Extract (original, better) sentence pairs from the model's Corrected: section."""
+    pairs = []
+    original = None
+    for line in text.splitlines():
+        line = line.strip()
+        match = _ORIGINAL_RE.match(line)
+        if match:
+            original = _clean(match.group(1))
+            continue
+        match = _BETTER_RE.match(line)
+        if match and original:
+            better = _clean(match.group(1))
+            if better and better != original:
+                pairs.append((original, better))
+            original = None
+    return pairs
+
+
+def mistake_phrases(original: str, better: str) -> list[tuple[str, str]]:
+    """Word-level differences between two sentences, e.g. ('slept', 'went to bed')."""
+    old = _WORD_RE.findall(original.lower())
+    new = _WORD_RE.findall(better.lower())
+    phrases = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(a=old, b=new, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            continue
+        if i2 - i1 > MAX_MISTAKE_WORDS or j2 - j1 > MAX_MISTAKE_WORDS:
+            continue
+        phrases.append((' '.join(old[i1:i2]), ' '.join(new[j1:j2])))
+    return phrases
+
+
+def process_new_messages(batch_size: int = ANALYTICS_BATCH_SIZE, max_batches: int | None = None) -> int:
+    """Fold conversation rows added since the last run into the per-user aggregates.
+
+    Rows are tailed by rowid and each batch is applied in the same transaction
+    that advances the cursor, so every row is counted exactly once.
+    Returns the number of rows processed.
+    """
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        processed = _process_batch(batch_size)
+        total += processed
+        batches += 1
+        if processed < batch_size:
+            break
+    if total:
+        logger.info(f"Analytics processed {total} new conversation rows")
+    return total
+
+
+def _process_batch(batch_size: int) -> int:
+    try:
+        with get_db() as db:
+            # Take the write lock up front so concurrent runs can't read the same cursor
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute('''
+                SELECT last_rowid FROM analytics_cursor WHERE name = ?
+            ''', (CURSOR_NAME,)).fetchone()
+            last_rowid = row[0] if row else 0
+
+            rows = db.execute('''
+                SELECT id, user_id, role, message, timestamp FROM conversations
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (last_rowid, batch_size)).fetchall()
+            if not rows:
+                db.execute('ROLLBACK')
+                return 0
+
+            users: dict[int, list] = {}   # user_id -> [messages, words, corrections, first, last]
+            days: dict[tuple, list] = {}  # (user_id, day) -> [messages, words, corrections]
+            mistakes: dict[tuple, list] = {}  # (user_id, original, better) -> [count, last_seen]
+
+            for _, user_id, role, message, timestamp in rows:
+                if role == 'user':
+                    counts = (1, len(_WORD_RE.findall(message)), 0)
+                elif role == 'correction':
+                    pairs = extract_corrections(message)
+                    counts = (0, 0, len(pairs))
+                    for original, better in pairs:
+                        for phrase in mistake_phrases(original, better):
+                            entry = mistakes.setdefault((user_id, *phrase), [0, timestamp])
+                            entry[0] += 1
+                            entry[1] = timestamp
+                else:
+                    continue
+
+                user = users.setdefault(user_id, [0, 0, 0, timestamp, timestamp])
+                day = days.setdefault((user_id, timestamp[:10]), [0, 0, 0])
+                for i in range(3):
+                    user[i] += counts[i]
+                    day[i] += counts[i]
+                user[4] = timestamp
+
+            db.executemany('''
+                INSERT INTO user_stats (user_id, messages, words, corrections, first_message_at, last_message_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    messages = messages + excluded.messages,
+                    words = words + excluded.words,
+                    corrections = corrections + excluded.corrections,
+                    last_message_at = excluded.last_message_at
+            ''', [(user_id, *values) for user_id, values in users.items()])
+
+            db.executemany('''
+                INSERT INTO user_daily_stats (user_id, day, messages, words, corrections)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, day) DO UPDATE SET
+                    messages = messages + excluded.messages,
+                    words = words + excluded.words,
+                    corrections = corrections + excluded.corrections
+            ''', [(*key, *values) for key, values in days.items()])
+
+            db.executemany('''
+                INSERT INTO user_mistakes (user_id, original, better, count, last_seen)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, original, better) DO UPDATE SET
+                    count = count + excluded.count,
+                    last_seen = excluded.last_seen
+            ''', [(*key, *values) for key, values in mistakes.items()])
+
+            db.execute('''
+                INSERT INTO analytics_cursor (name, last_rowid) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET last_rowid = excluded.last_rowid
+            ''', (CURSOR_NAME, rows[-1][0]))
+            log_db_operation("ANALYTICS", f"Processed rows {rows[0][0]}-{rows[-1][0]} for {len(users)} users")
+            return len(rows)
+    except Exception as e:
+        logger.error(f"Error processing analytics batch: {e}")
+        raise
+
+
+def get_progress(user_id: int, today: date | None = None) -> dict | None:
+    """Read a user's learning progress from the summary tables.
+
+    Only touches a bounded number of rows, however long the history is.
+    """
+    # Conversation timestamps are stored in UTC
+    today = today or datetime.now(timezone.utc).date()
+    this_week_start = (today - timedelta(days=6)).isoformat()
+    last_week_start = (today - timedelta(days=13)).isoformat()
+    try:
+        with get_db() as db:
+            stats = db.execute('''
+                SELECT messages, words, corrections, first_message_at, last_message_at
+                FROM user_stats WHERE user_id = ?
+            ''', (user_id,)).fetchone()
+            if not stats:
+                return None
+
+            weeks = db.execute('''
+                SELECT day >= ?, SUM(messages), SUM(words), SUM(corrections)
+                FROM user_daily_stats
+                WHERE user_id = ? AND day >= ?
+                GROUP BY day >= ?
+            ''', (this_week_start, user_id, last_week_start, this_week_start)).fetchall()
+
+            top_mistakes = db.execute('''
+                SELECT original, better, count FROM user_mistakes
+                WHERE user_id = ?
+                ORDER BY count DESC
+                LIMIT 3
+            ''', (user_id,)).fetchall()
+    except Exception as e:
+        logger.error(f"Error getting progress for user {user_id}: {e}")
+        raise
+
+    messages, words, corrections, first_message_at, last_message_at = stats
+    week = {bool(this_week): (m, w, c) for this_week, m, w, c in weeks}
+    this_week = week.get(True, (0, 0, 0))
+    last_week = week.get(False, (0, 0, 0))
+    return {
+        'messages': messages,
+        'words': words,
+        'corrections': corrections,
+        'words_per_message': words / messages if messages else 0.0,
+        'first_message_at': first_message_at,
+        'last_message_at': last_message_at,
+        'this_week': {'messages': this_week[0], 'words_per_message': this_week[1] / this_week[0] if this_week[0] else 0.0,
+                      'corrections': this_week[2]},
+        'last_week': {'messages': last_week[0], 'words_per_message': last_week[1] / last_week[0] if last_week[0] else 0.0,
+                      'corrections': last_week[2]},
+        'top_mistakes': [{'original': o, 'better': b, 'count': c} for o, b, c in top_mistakes],
+    }
+
+
+def format_progress(progress: dict | None) -> str:
+    """Render progress as a chat message."""
+    if not progress:
+        return "I don't have any progress to show yet. Send me a few messages and check again!"
+
+    this_week = progress['this_week']
+    last_week = progress['last_week']
+    lines = [
+        "📈 Your progress",
+        f"Messages sent: {progress['messages']} ({this_week['messages']} this week)",
+        f"Average words per message: {progress['words_per_message']:.1f}",
+        f"This week: {this_week['words_per_message']:.1f} words/message, last week: {last_week['words_per_message']:.1f}",
+        f"Corrections so far: {progress['corrections']} ({this_week['corrections']} this week)",
+    ]
+    if progress['top_mistakes']:
+        lines.append("\nYour most common mistakes:")
+        for mistake in progress['top_mistakes']:
+            original, better, count = mistake['original'], mistake['better'], mistake['count']
+            if not original:
+                lines.append(f'- missing "{better}" ({count}x)')
+            elif not better:
+                lines.append(f'- unnecessary "{original}" ({count}x)')
+            else:
+                lines.append(f'- "{original}" → "{better}" ({count}x)')
+    return '\n'.join(lines)
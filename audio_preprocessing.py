@@ -0,0 +1,133 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+from pydub import AudioSegment
+from logger_config import setup_logger
+
+# Load environment variables
+load_dotenv()
+TARGET_SAMPLE_RATE = int(os.getenv('VOICE_SAMPLE_RATE', '16000'))
+MAX_DURATION_S = float(os.getenv('VOICE_MAX_DURATION_S', '60'))
+TARGET_DBFS = float(os.getenv('VOICE_TARGET_DBFS', '-20'))
+VAD_MARGIN_DB = float(os.getenv('VOICE_VAD_MARGIN_DB', '12'))
+
+# Setup logger
+logger = setup_logger('audio_preprocessing', 'audio_preprocessing.log')
+
+FRAME_MS = 30           # VAD frame length
+PADDING_MS = 200        # audio kept around the detected speech
+SILENCE_FLOOR_DB = -50  # frames quieter than this are never speech
+MAX_GAIN_DB = 20        # never boost quiet recordings by more than this
+PEAK_CEILING_DB = -1    # keep normalized peaks below this level
+LOWPASS_CUTOFF = 0.9    # anti-aliasing cutoff as a fraction of the target Nyquist frequency
+LOWPASS_TAPS_PER_RATIO = 32  # filter length per unit of downsampling ratio
+
+_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+def to_mono_array(audio: AudioSegment) -> np.ndarray:
+    """Return the audio as a mono float32 array in [-1, 1]."""
+    if audio.sample_width not in _DTYPES:
+        audio = audio.set_sample_width(2)
+    samples = np.frombuffer(audio.raw_data, dtype=_DTYPES[audio.sample_width]).astype(np.float32)
+    samples /= float(2 ** (8 * audio.sample_width - 1))
+    if audio.channels > 1:
+        samples = samples.reshape(-1, audio.channels).mean(axis=1)
+    return samples
+
+
+def lowpass(samples: np.ndarray, sample_rate: int, cutoff_hz: float) -> np.ndarray:
+    """Windowed-sinc FIR low-pass filter, used to band-limit audio before downsampling."""
+    taps = LOWPASS_TAPS_PER_RATIO * int(np.ceil(sample_rate / (2 * cutoff_hz))) + 1
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff_hz / sample_rate * n) * np.hamming(taps)
+    kernel /= kernel.sum()
+    return np.convolve(samples, kernel.astype(np.float32), mode='same').astype(np.float32)
+
+
+def resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """Resample a mono signal, low-pass filtering first when downsampling to avoid aliasing."""
+    if source_rate == target_rate or samples.size == 0:
+        return samples
+    if source_rate > target_rate:
+        samples = lowpass(samples, source_rate, LOWPASS_CUTOFF * target_rate / 2)
+        if source_rate % target_rate == 0:
+            return samples[::source_rate // target_rate]
+    duration = samples.size / source_rate
+    target_times = np.arange(int(duration * target_rate)) / target_rate
+    source_times = np.arange(samples.size) / source_rate
+    return np.interp(target_times, source_times, samples).astype(np.float32)
+
+
+def frame_levels_db(samples: np.ndarray, sample_rate: int, frame_ms: int = FRAME_MS) -> np.ndarray:
+    """RMS level in dBFS of each fixed-size frame."""
+    frame_len = max(1, sample_rate * frame_ms // 1000)
+    frame_count = samples.size // frame_len
+    if frame_count == 0:
+        return np.empty(0, dtype=np.float32)
+    frames = samples[:frame_count * frame_len].reshape(frame_count, frame_len)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def trim_silence(samples: np.ndarray, sample_rate: int, margin_db: float = VAD_MARGIN_DB,
+                 padding_ms: int = PADDING_MS) -> np.ndarray:
+    """Drop leading and trailing silence using an energy VAD with an adaptive noise floor."""
+    levels = frame_levels_db(samples, sample_rate)
+    if levels.size == 0:
+        return samples
+    noise_floor = np.percentile(levels, 10)
+    threshold = max(noise_floor + margin_db, SILENCE_FLOOR_DB)
+    voiced = np.flatnonzero(levels > threshold)
+    if voiced.size == 0:
+        # Nothing looks like speech; let the recognizer decide
+        return samples
+
+    frame_len = max(1, sample_rate * FRAME_MS // 1000)
+    padding = sample_rate * padding_ms // 1000
+    start = max(0, voiced[0] * frame_len - padding)
+    end = min(samples.size, (voiced[-1] + 1) * frame_len + padding)
+    return samples[start:end]
+
+
+def normalize_loudness(samples: np.ndarray, target_dbfs: float = TARGET_DBFS) -> np.ndarray:
+    """Scale the signal towards a target RMS level without clipping."""
+    if samples.size == 0:
+        return samples
+    rms = float(np.sqrt(np.mean(samples * samples)))
+    peak = float(np.max(np.abs(samples)))
+    if rms <= 0 or peak <= 0:
+        return samples
+    gain_db = min(target_dbfs - 20 * np.log10(rms), MAX_GAIN_DB)
+    gain_db = min(gain_db, PEAK_CEILING_DB - 20 * np.log10(peak))
+    return samples * np.float32(10 ** (gain_db / 20))
+
+
+def from_mono_array(samples: np.ndarray, sample_rate: int) -> AudioSegment:
+    """Build a 16-bit mono AudioSegment from a float array in [-1, 1]."""
+    pcm = np.clip(samples * 32767, -32768, 32767).astype(np.int16)
+    return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=sample_rate, channels=1)
+
+
+def preprocess_audio(audio: AudioSegment, sample_rate: int = TARGET_SAMPLE_RATE,
+                     max_duration_s: float = MAX_DURATION_S) -> AudioSegment:
+    """Prepare a voice message for speech recognition.
+
+    Downmixes to mono, resamples, trims leading and trailing silence,
+    caps the duration and normalizes loudness.
+    """
+    samples = to_mono_array(audio)
+    samples = resample(samples, audio.frame_rate, sample_rate)
+    samples = trim_silence(samples, sample_rate)
+    if max_duration_s:
+        samples = samples[:int(max_duration_s * sample_rate)]
+    samples = normalize_loudness(samples)
+    processed = from_mono_array(samples, sample_rate)
+
+    original_bytes = len(audio.raw_data)
+    processed_bytes = len(processed.raw_data)
+    logger.info(
+        f"Preprocessed audio: {len(audio) / 1000:.1f}s {audio.frame_rate}Hz {audio.channels}ch -> "
+        f"{len(processed) / 1000:.1f}s {sample_rate}Hz 1ch, PCM {original_bytes} -> {processed_bytes} bytes"
+    )
+    return processed
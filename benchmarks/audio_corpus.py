@@ -0,0 +1,151 @@
+"""Measure what voice pre-processing saves on a corpus of voice messages.
+
+For every clip this compares the old path (full-rate WAV) with the
+pre-processed one (trimmed, mono, 16 kHz, normalized) and reports the FLAC
+bytes speech_recognition would upload, the pre-processing cost, and either
+the estimated upload time saved or, with --stt, measured Google STT latency.
+
+Usage:
+    python -m benchmarks.audio_corpus                      # synthetic corpus
+    python -m benchmarks.audio_corpus --corpus voice_samples/ --output audio.json
+    python -m benchmarks.audio_corpus --corpus voice_samples/ --stt
+"""
+import argparse
+import io
+import json
+import os
+import time
+
+import numpy as np
+import speech_recognition as sr
+from pydub import AudioSegment
+
+from audio_preprocessing import preprocess_audio
+
+AUDIO_EXTENSIONS = ('.ogg', '.oga', '.wav', '.mp3', '.m4a', '.flac')
+
+
+def synthetic_clip(seed: int, speech_s: float, lead_s: float, tail_s: float,
+                   sample_rate: int, channels: int, level_db: float) -> AudioSegment:
+    """Speech-like signal (voiced harmonics with a syllable-rate envelope) padded with room noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(speech_s * sample_rate)) / sample_rate
+    pitch = 120 + 40 * rng.random()
+    voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t + rng.random() * np.pi), 0, None)
+    speech = voiced * envelope
+    speech *= 10 ** (level_db / 20) / max(np.sqrt(np.mean(speech ** 2)), 1e-9)
+
+    def noise(seconds):
+        return rng.normal(0, 10 ** (-60 / 20), int(seconds * sample_rate))
+
+    signal = np.concatenate([noise(lead_s), speech + noise(speech_s)[:speech.size], noise(tail_s)])
+    frames = np.repeat(signal[:, None], channels, axis=1).reshape(-1)
+    pcm = np.clip(frames * 32767, -32768, 32767).astype(np.int16)
+    return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=sample_rate, channels=channels)
+
+
+def synthetic_corpus() -> list[tuple[str, AudioSegment]]:
+    specs = [
+        (3, 1.5, 1.0, 48000, 1, -24),
+        (6, 2.0, 2.5, 48000, 2, -30),
+        (10, 0.8, 0.5, 44100, 2, -18),
+        (15, 3.0, 1.5, 48000, 1, -35),
+        (25, 1.0, 4.0, 48000, 1, -22),
+    ]
+    return [
+        (f"synthetic_{i + 1}_{speech}s", synthetic_clip(i, speech, lead, tail, rate, channels, level))
+        for i, (speech, lead, tail, rate, channels, level) in enumerate(specs)
+    ]
+
+
+def load_corpus(directory: str) -> list[tuple[str, AudioSegment]]:
+    clips = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(AUDIO_EXTENSIONS):
+            clips.append((name, AudioSegment.from_file(os.path.join(directory, name))))
+    return clips
+
+
+def recognizer_audio(audio: AudioSegment) -> sr.AudioData:
+    """Load a segment the way process_voice_message does: WAV file -> sr.AudioFile."""
+    wav = io.BytesIO()
+    audio.export(wav, format='wav')
+    wav.seek(0)
+    with sr.AudioFile(wav) as source:
+        return sr.Recognizer().record(source)
+
+
+def upload_bytes(audio_data: sr.AudioData) -> int:
+    """Size of the FLAC payload recognize_google sends for this audio."""
+    convert_rate = None if audio_data.sample_rate >= 8000 else 8000
+    return len(audio_data.get_flac_data(convert_rate=convert_rate, convert_width=2))
+
+
+def time_stt(audio_data: sr.AudioData) -> float | None:
+    t0 = time.perf_counter()
+    try:
+        sr.Recognizer().recognize_google(audio_data)
+    except sr.UnknownValueError:
+        pass
+    except sr.RequestError:
+        return None
+    return (time.perf_counter() - t0) * 1000
+
+
+def measure(name: str, audio: AudioSegment, uplink_kbps: float, stt: bool) -> dict:
+    before = recognizer_audio(audio)
+    t0 = time.perf_counter()
+    processed = preprocess_audio(audio)
+    preprocess_ms = (time.perf_counter() - t0) * 1000
+    after = recognizer_audio(processed)
+
+    bytes_before = upload_bytes(before)
+    bytes_after = upload_bytes(after)
+    result = {
+        'clip': name,
+        'duration_s': [round(len(audio) / 1000, 2), round(len(processed) / 1000, 2)],
+        'format': [f"{audio.frame_rate}Hz/{audio.channels}ch", f"{processed.frame_rate}Hz/{processed.channels}ch"],
+        'upload_bytes': [bytes_before, bytes_after],
+        'preprocess_ms': round(preprocess_ms, 2),
+        'upload_ms_saved': round((bytes_before - bytes_after) * 8 / uplink_kbps, 1),
+    }
+    if stt:
+        result['stt_ms'] = [time_stt(before), time_stt(after)]
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Report savings from voice pre-processing')
+    parser.add_argument('--corpus', help='Directory of voice clips (default: synthetic corpus)')
+    parser.add_argument('--uplink-kbps', type=float, default=1000, help='Uplink bandwidth for the upload time estimate')
+    parser.add_argument('--stt', action='store_true', help='Also time real Google STT requests (needs network)')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    clips = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    results = [measure(name, audio, args.uplink_kbps, args.stt) for name, audio in clips]
+
+    print(f"{'clip':<24}{'duration s':>14}{'upload bytes':>20}{'saved':>8}{'prep ms':>9}{'upload ms saved':>17}")
+    for r in results:
+        before, after = r['upload_bytes']
+        print(
+            f"{r['clip'][:23]:<24}{r['duration_s'][0]:>6.1f} -> {r['duration_s'][1]:<5.1f}"
+            f"{before:>9} -> {after:<8}{1 - after / before:>8.0%}{r['preprocess_ms']:>9.1f}{r['upload_ms_saved']:>17.1f}"
+        )
+        if 'stt_ms' in r:
+            print(f"{'':<24}STT ms: {r['stt_ms'][0]} -> {r['stt_ms'][1]}")
+
+    total_before = sum(r['upload_bytes'][0] for r in results)
+    total_after = sum(r['upload_bytes'][1] for r in results)
+    if total_before:
+        print(f"\nTotal upload: {total_before} -> {total_after} bytes ({1 - total_after / total_before:.0%} less)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'uplink_kbps': args.uplink_kbps, 'clips': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""Local stand-ins for the Telegram Bot API, OpenAI and Google Speech endpoints.
+
+Each server runs in its own thread so that artificial latency never blocks the
+bot's event loop; only the bot's own code can do that, which is what the
+benchmarks are meant to measure.
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FaultConfig:
+    """Latency and error injection settings for a fake server."""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0, retry_after_rate: float = 0, retry_after: int = 1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_dict(cls, data: dict | None) -> "FaultConfig":
+        return cls(**(data or {}))
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class FakeServer:
+    """Threaded HTTP server with per-request latency and fault injection."""
+
+    def __init__(self, name: str, seed: int = 0):
+        self.name = name
+        self.faults = FaultConfig()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters: dict[str, int] = {}
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=name, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self, faults: FaultConfig | None = None) -> None:
+        """Clear counters and apply new fault settings for the next scenario."""
+        with self._lock:
+            self.counters = {}
+            self.faults = faults or FaultConfig()
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def _roll(self) -> tuple[float, str | None]:
+        """Pick the delay and injected fault ('error', 'retry_after' or None) for a request."""
+        with self._lock:
+            faults = self.faults
+            delay = max(0.0, faults.latency_ms + self._random.uniform(-faults.jitter_ms, faults.jitter_ms)) / 1000
+            roll = self._random.random()
+        if roll < faults.error_rate:
+            return delay, 'error'
+        if roll < faults.error_rate + faults.retry_after_rate:
+            return delay, 'retry_after'
+        return delay, None
+
+    def handle(self, method: str, path: str, headers, body: bytes) -> tuple[int, str, bytes]:
+        """Return (status, content type, body) for a request. Overridden by subclasses."""
+        raise NotImplementedError
+
+    def fault_response(self, fault: str) -> tuple[int, str, bytes]:
+        """Response body for an injected fault. Overridden by subclasses."""
+        return 500, 'text/plain', b'injected error'
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _dispatch(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                delay, fault = server._roll()
+                if delay:
+                    time.sleep(delay)
+                if fault:
+                    server.count(f"injected_{fault}")
+                    status, content_type, payload = server.fault_response(fault)
+                else:
+                    try:
+                        status, content_type, payload = server.handle(method, self.path, self.headers, body)
+                    except Exception as e:
+                        status, content_type, payload = 500, 'text/plain', str(e).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _json(status: int, data) -> tuple[int, str, bytes]:
+    return status, 'application/json', json.dumps(data).encode()
+
+
+class FakeTelegramServer(FakeServer):
+    """Minimal Telegram Bot API: enough for getMe, sends, deletes and file downloads."""
+
+    def __init__(self, seed: int = 0, voice_payload: bytes = b''):
+        super().__init__('fake-telegram', seed)
+        self.voice_payload = voice_payload
+        self._message_id = 0
+
+    def fault_response(self, fault):
+        if fault == 'retry_after':
+            retry_after = self.faults.retry_after
+            return _json(429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {retry_after}",
+                'parameters': {'retry_after': retry_after},
+            })
+        return _json(502, {'ok': False, 'error_code': 502, 'description': 'Bad Gateway'})
+
+    def _next_message_id(self) -> int:
+        with self._lock:
+            self._message_id += 1
+            return self._message_id
+
+    @staticmethod
+    def _chat_id(headers, body: bytes) -> int:
+        content_type = headers.get('Content-Type', '')
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            values = parse_qs(body.decode()).get('chat_id')
+            return int(values[0]) if values else 0
+        match = re.search(rb'name="chat_id"\r\n\r\n(-?\d+)', body)
+        return int(match.group(1)) if match else 0
+
+    def handle(self, method, path, headers, body):
+        parts = urlsplit(path).path.strip('/').split('/')
+        if parts[0] == 'file':
+            self.count('download')
+            return 200, 'audio/ogg', self.voice_payload
+
+        api_method = parts[-1]
+        self.count(api_method)
+        now = int(time.time())
+        if api_method == 'getMe':
+            return _json(200, {'ok': True, 'result': {
+                'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot',
+                'can_join_groups': False, 'can_read_all_group_messages': False,
+                'supports_inline_queries': False,
+            }})
+        if api_method == 'getFile':
+            file_id = parse_qs(body.decode()).get('file_id', ['voice'])[0]
+            return _json(200, {'ok': True, 'result': {
+                'file_id': file_id, 'file_unique_id': file_id,
+                'file_size': len(self.voice_payload), 'file_path': f"voice/{file_id}.ogg",
+            }})
+        if api_method in ('deleteMessage', 'answerCallbackQuery'):
+            return _json(200, {'ok': True, 'result': True})
+        # Every send* method answers with a plain text message
+        chat_id = self._chat_id(headers, body)
+        return _json(200, {'ok': True, 'result': {
+            'message_id': self._next_message_id(), 'date': now,
+            'chat': {'id': chat_id, 'type': 'private'}, 'text': 'ok',
+        }})
+
+
+class FakeOpenAIServer(FakeServer):
+    """OpenAI-compatible /v1/chat/completions endpoint with canned tutor replies.
+
+    Reports cached prompt tokens the way OpenAI's prompt caching does: only
+    prompts of at least 1024 tokens are cached, in 128-token increments, and
+    only a prefix seen on an earlier request can hit. The cacheable prefix is
+    taken to be the system message; tokens are counted as words.
+    """
+
+    CACHE_MIN_TOKENS = 1024
+    CACHE_INCREMENT = 128
+
+    def __init__(self, seed: int = 0):
+        super().__init__('fake-openai', seed)
+        self._seen_prefixes: set[str] = set()
+
+    def reset(self, faults: FaultConfig | None = None) -> None:
+        super().reset(faults)
+        with self._lock:
+            self._seen_prefixes = set()
+
+    def cached_tokens(self, prefix: str, prompt_tokens: int) -> int:
+        """Cached tokens for a request, remembering its prefix for later ones."""
+        with self._lock:
+            hit = prefix in self._seen_prefixes
+            self._seen_prefixes.add(prefix)
+        if not hit or prompt_tokens < self.CACHE_MIN_TOKENS:
+            return 0
+        cached = min(len(prefix.split()), prompt_tokens) // self.CACHE_INCREMENT * self.CACHE_INCREMENT
+        return cached if cached >= self.CACHE_MIN_TOKENS else 0
+
+    def fault_response(self, fault):
+        if fault == 'retry_after':
+            return _json(429, {'error': {'message': 'Rate limit reached', 'type': 'rate_limit_error'}})
+        return _json(500, {'error': {'message': 'Injected server error', 'type': 'server_error'}})
+
+    def handle(self, method, path, headers, body):
+        self.count('chat.completions')
+        request = json.loads(body or b'{}')
+        messages = request.get('messages', [])
+        system = messages[0]['content'] if messages else ''
+        user = messages[-1]['content'] if messages else ''
+
+        if 'I heard:' in system:
+            content = f"I heard: {user}\n\nAI: That sounds great! What else did you do today?"
+        elif user.startswith('Start a conversation about'):
+            content = "AI: What do you enjoy most about this topic?"
+        else:
+            content = (
+                "AI: That's interesting! What did you do next?\n\n"
+                "Corrected:\n"
+                f"- Original: \"{user}\"\n"
+                "- Better: \"I went to the park yesterday\"\n"
+                "- Why: Use the past tense for finished actions"
+            )
+
+        prompt_tokens = sum(len(m.get('content', '').split()) for m in messages)
+        completion_tokens = len(content.split())
+        return _json(200, {
+            'id': f"chatcmpl-bench-{self.counters.get('chat.completions', 0)}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'gpt-4o-mini'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+                'prompt_tokens_details': {'cached_tokens': self.cached_tokens(system, prompt_tokens)},
+            },
+        })
+
+
+class FakeSpeechServer(FakeServer):
+    """Google Speech API v2 stand-in, reached through the http_proxy environment variable."""
+
+    def __init__(self, seed: int = 0, transcript: str = 'I went to the park yesterday'):
+        super().__init__('fake-speech', seed)
+        self.transcript = transcript
+
+    def handle(self, method, path, headers, body):
+        self.count('recognize')
+        self.count_bytes(len(body))
+        result = {'result': [{'alternative': [{'transcript': self.transcript, 'confidence': 0.9}], 'final': True}],
+                  'result_index': 0}
+        payload = '{"result":[]}\n' + json.dumps(result) + '\n'
+        return 200, 'application/json', payload.encode()
+
+    def count_bytes(self, size: int) -> None:
+        with self._lock:
+            self.counters['bytes_received'] = self.counters.get('bytes_received', 0) + size
@@ -0,0 +1,418 @@
+"""Offline replay benchmarks for the bot's update handlers.
+
+Drives the real Application handlers from main.py with synthetic or recorded
+update traces against local fake Telegram, OpenAI and Google Speech servers,
+and reports throughput, latency percentiles and event-loop lag per scenario.
+
+Usage:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --only text_baseline --output results.json
+    python -m benchmarks.run_benchmarks --output new.json --compare results.json
+"""
+import argparse
+import asyncio
+import importlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fake_servers import FaultConfig, FakeOpenAIServer, FakeSpeechServer, FakeTelegramServer
+
+BENCH_TOKEN = '123456:BENCHMARK'
+DEFAULT_SCENARIOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios.json')
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_LOGGERS = (
+    'bot', 'database', 'text_handler', 'speech_handler', 'utils', 'prompts', 'loop_watchdog',
+    'outbound_dispatcher', 'audio_preprocessing', 'analytics', 'daily_practice',
+)
+
+SAMPLE_TEXTS = [
+    "Yesterday I go to the park with my friends",
+    "I am very tired because I slept very late yesterday",
+    "What do you think about learning English with movies?",
+    "My favourite food is pizza but I don't cook it never",
+    "I have been working in this company since three years",
+    "Can you recommend me a good book for reading?",
+]
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q / 100
+    low = int(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+
+def summarize(values: list[float]) -> dict:
+    ordered = sorted(values)
+    return {
+        'mean': round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        'p50': round(percentile(ordered, 50), 3),
+        'p95': round(percentile(ordered, 95), 3),
+        'p99': round(percentile(ordered, 99), 3),
+        'max': round(ordered[-1], 3) if ordered else 0.0,
+    }
+
+
+class ErrorLogCounter(logging.Handler):
+    """Counts ERROR records from the bot's loggers; handlers log and swallow most failures."""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def attach_error_counter(verbose: bool) -> ErrorLogCounter:
+    counter = ErrorLogCounter()
+    for name in BOT_LOGGERS:
+        bot_logger = logging.getLogger(name)
+        if not verbose:
+            bot_logger.setLevel(logging.WARNING)
+            for handler in bot_logger.handlers:
+                if type(handler) is logging.StreamHandler:
+                    handler.setLevel(logging.CRITICAL + 1)
+        bot_logger.addHandler(counter)
+    return counter
+
+
+class LoopLagSampler:
+    """Measures how late the event loop wakes up from short sleeps."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected) * 1000)
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def make_voice_sample() -> bytes | None:
+    """Build a short OGG/Opus voice note, or None if ffmpeg is not available."""
+    if not shutil.which('ffmpeg'):
+        return None
+    from pydub import AudioSegment
+    from pydub.generators import Sine
+
+    audio = AudioSegment.silent(duration=400) + Sine(440).to_audio_segment(duration=1500) + AudioSegment.silent(duration=400)
+    buffer = io.BytesIO()
+    audio.export(buffer, format='ogg', codec='libopus')
+    return buffer.getvalue()
+
+
+def synthetic_updates(kind: str, count: int, users: int, rng: random.Random, topics: list[str]) -> list[dict]:
+    """Generate raw Telegram update payloads for a scenario kind."""
+    updates = []
+    for n in range(count):
+        user_id = 10_000 + n % users
+        message = {
+            'message_id': n + 1,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"},
+        }
+        update_kind = kind if kind != 'mixed' else rng.choice(['text', 'text', 'text', 'topic', 'voice'])
+        if update_kind == 'text':
+            message['text'] = rng.choice(SAMPLE_TEXTS)
+        elif update_kind == 'topic':
+            message['text'] = rng.choice(topics)
+        elif update_kind == 'voice':
+            message['voice'] = {'file_id': f"voice{n}", 'file_unique_id': f"voice{n}", 'duration': 2}
+        else:
+            raise ValueError(f"Unknown scenario kind: {kind}")
+        updates.append({'update_id': n + 1, 'message': message})
+    return updates
+
+
+def load_trace(path: str) -> list[tuple[float | None, dict]]:
+    """Load a JSONL trace of updates.
+
+    Each line is either a raw update, or {"at": seconds_from_start, "update": {...}}
+    for recorded traces that should be replayed with their original timing.
+    """
+    entries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            if 'update' in data:
+                entries.append((data.get('at'), data['update']))
+            else:
+                entries.append((None, data))
+    return entries
+
+
+def needs_voice(updates: list[dict]) -> bool:
+    return any('voice' in (u.get('message') or {}) for u in updates)
+
+
+def configure_environment(workdir: str, openai: FakeOpenAIServer, speech: FakeSpeechServer) -> None:
+    """Point the bot's modules at the fake servers. Must run before they are imported."""
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'bench.db')
+    os.environ['OPENAI_API_KEY'] = 'benchmark'
+    os.environ['OPENAI_BASE_URL'] = f"{openai.url}/v1"
+    # speech_recognition talks plain HTTP to www.google.com, so route it through the fake server
+    for name in ('http_proxy', 'HTTP_PROXY'):
+        os.environ[name] = speech.url
+    for name in ('no_proxy', 'NO_PROXY'):
+        os.environ[name] = '127.0.0.1,localhost'
+
+
+async def build_application(bot_module, telegram: FakeTelegramServer, errors: list):
+    from telegram.ext import Application
+
+    application = (
+        Application.builder()
+        .token(BENCH_TOKEN)
+        .base_url(f"{telegram.url}/bot")
+        .base_file_url(f"{telegram.url}/file/bot")
+        .build()
+    )
+    bot_module.register_handlers(application)
+
+    async def count_error(update, context):
+        errors.append(repr(context.error))
+
+    application.add_error_handler(count_error)
+    await application.initialize()
+    await bot_module.post_init(application)
+    return application
+
+
+async def run_scenario(application, bot_module, servers: dict, scenario: dict, errors: list,
+                       voice_available: bool, seed: int) -> dict:
+    name = scenario['name']
+    kind = scenario.get('kind', 'text')
+    rng = random.Random(seed)
+
+    if kind == 'trace':
+        trace_path = scenario['trace']
+        if not os.path.isabs(trace_path):
+            trace_path = os.path.join(REPO_ROOT, trace_path)
+        entries = load_trace(trace_path)
+    else:
+        updates = synthetic_updates(kind, scenario.get('updates', 100), scenario.get('users', 10), rng, bot_module.TOPICS)
+        entries = [(None, update) for update in updates]
+
+    if needs_voice([update for _, update in entries]) and not voice_available:
+        return {'name': name, 'kind': kind, 'skipped': 'voice scenarios need ffmpeg to build the sample audio'}
+
+    for key, server in servers.items():
+        server.reset(FaultConfig.from_dict(scenario.get(key)))
+    errors.clear()
+
+    from telegram import Update
+    from prompts import get_usage_stats, reset_usage_stats
+
+    concurrency = scenario.get('concurrency', 1)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    loop = asyncio.get_running_loop()
+
+    async def process(at: float | None, raw: dict, started: float):
+        if at is not None:
+            await asyncio.sleep(max(0.0, started + at - loop.time()))
+        async with semaphore:
+            update = Update.de_json(raw, application.bot)
+            t0 = time.perf_counter()
+            try:
+                await application.process_update(update)
+            except Exception as e:
+                errors.append(repr(e))
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    bot_module.watchdog.reset()
+    reset_usage_stats()
+    bot_module.dispatcher.stats = dict.fromkeys(bot_module.dispatcher.stats, 0)
+    sampler = LoopLagSampler(scenario.get('lag_interval_ms', 10) / 1000)
+    sampler.start()
+    started = loop.time()
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(process(at, raw, started) for at, raw in entries))
+    duration = time.perf_counter() - wall_start
+    await sampler.stop()
+
+    return {
+        'name': name,
+        'kind': kind,
+        'updates': len(entries),
+        'users': scenario.get('users'),
+        'concurrency': concurrency,
+        'duration_s': round(duration, 3),
+        'throughput_ups': round(len(entries) / duration, 3) if duration else 0.0,
+        'latency_ms': summarize(latencies),
+        'loop_lag_ms': summarize(sampler.samples),
+        'handler_errors': len(errors),
+        'blocking_offenders': bot_module.watchdog.top_offenders(),
+        'dispatcher': dict(bot_module.dispatcher.stats),
+        'prompt_usage': get_usage_stats(),
+        'server_requests': {key: dict(server.counters) for key, server in servers.items()},
+        'faults': {key: server.faults.to_dict() for key, server in servers.items()},
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def cached_ratio(prompt_usage: dict) -> float:
+    """Share of prompt tokens served from the provider's prompt cache, over all prompts."""
+    prompt_tokens = sum(stats['prompt_tokens'] for stats in prompt_usage.values())
+    cached_tokens = sum(stats['cached_tokens'] for stats in prompt_usage.values())
+    return cached_tokens / prompt_tokens if prompt_tokens else 0.0
+
+
+def print_report(results: dict) -> None:
+    header = (
+        f"{'scenario':<24}{'ups':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'lag p99':>10}"
+        f"{'errors':>8}{'logged':>8}{'cached':>8}"
+    )
+    print(header)
+    print('-' * len(header))
+    for r in results['scenarios']:
+        if 'skipped' in r:
+            print(f"{r['name']:<24}skipped: {r['skipped']}")
+            continue
+        print(
+            f"{r['name']:<24}{r['throughput_ups']:>9.1f}{r['latency_ms']['p50']:>10.1f}"
+            f"{r['latency_ms']['p95']:>10.1f}{r['latency_ms']['p99']:>10.1f}"
+            f"{r['loop_lag_ms']['p99']:>10.1f}{r['handler_errors']:>8}{r['logged_errors']:>8}"
+            f"{cached_ratio(r['prompt_usage']):>8.0%}"
+        )
+
+
+def print_comparison(results: dict, baseline: dict) -> None:
+    """Print relative changes against a previous results file."""
+    previous = {r['name']: r for r in baseline.get('scenarios', []) if 'skipped' not in r}
+    print(f"\nCompared with {baseline.get('git_revision') or 'baseline'} ({baseline.get('started_at')}):")
+    for r in results['scenarios']:
+        old = previous.get(r['name'])
+        if 'skipped' in r or not old:
+            continue
+
+        def delta(new, prev):
+            return f"{(new - prev) / prev:+.1%}" if prev else 'n/a'
+
+        print(
+            f"  {r['name']:<22} throughput {delta(r['throughput_ups'], old['throughput_ups'])}, "
+            f"p95 {delta(r['latency_ms']['p95'], old['latency_ms']['p95'])}, "
+            f"lag p99 {delta(r['loop_lag_ms']['p99'], old['loop_lag_ms']['p99'])}"
+        )
+
+
+async def run(args) -> dict:
+    with open(args.scenarios) as f:
+        scenarios = json.load(f)
+    if args.only:
+        scenarios = [s for s in scenarios if s['name'] in args.only]
+
+    voice_payload = make_voice_sample()
+    telegram = FakeTelegramServer(seed=args.seed, voice_payload=voice_payload or b'').start()
+    openai = FakeOpenAIServer(seed=args.seed).start()
+    speech = FakeSpeechServer(seed=args.seed).start()
+    servers = {'telegram': telegram, 'openai': openai, 'stt': speech}
+
+    workdir = tempfile.mkdtemp(prefix='tutor-bench-')
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)  # keeps logs/, voice_messages/ and the database out of the repo
+    errors: list = []
+    try:
+        configure_environment(workdir, openai, speech)
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)
+        bot_module = importlib.import_module('main')
+        error_counter = attach_error_counter(args.verbose)
+
+        application = await build_application(bot_module, telegram, errors)
+        results = {
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'seed': args.seed,
+            'scenarios': [],
+        }
+        try:
+            for i, scenario in enumerate(scenarios):
+                error_counter.count = 0
+                result = await run_scenario(
+                    application, bot_module, servers, scenario, errors,
+                    voice_available=voice_payload is not None, seed=args.seed + i,
+                )
+                if 'skipped' not in result:
+                    result['logged_errors'] = error_counter.count
+                results['scenarios'].append(result)
+        finally:
+            await bot_module.post_shutdown(application)
+            await application.shutdown()
+        return results
+    finally:
+        os.chdir(previous_cwd)
+        for server in servers.values():
+            server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Offline replay benchmarks for English Tutor Bot')
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS, help='JSON file with scenario definitions')
+    parser.add_argument('--only', nargs='+', help='Run only the named scenarios')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Previous results JSON file to compare against')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for synthetic traces and fault injection')
+    parser.add_argument('--verbose', action='store_true', help='Keep the bot INFO logs on the console')
+    args = parser.parse_args()
+    args.scenarios = os.path.abspath(args.scenarios)
+
+    results = asyncio.run(run(args))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
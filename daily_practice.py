@@ -0,0 +1,352 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from telegram.error import BadRequest, Forbidden
+from database import get_db, log_db_operation
+from logger_config import setup_logger
+from outbound_dispatcher import dispatcher, BACKGROUND
+from text_handler import generate_topic_question, TOPIC_QUESTION_FALLBACK
+
+# Load environment variables
+load_dotenv()
+DAILY_PRACTICE_ENABLED = os.getenv('DAILY_PRACTICE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+DAILY_PRACTICE_TIME = os.getenv('DAILY_PRACTICE_TIME', '09:00')  # UTC
+PRACTICE_PAGE_SIZE = int(os.getenv('PRACTICE_PAGE_SIZE', '500'))
+PRACTICE_GENERATION_CONCURRENCY = int(os.getenv('PRACTICE_GENERATION_CONCURRENCY', '4'))
+PRACTICE_MAX_PASSES = int(os.getenv('PRACTICE_MAX_PASSES', '3'))
+PRACTICE_RETRY_DELAY_S = float(os.getenv('PRACTICE_RETRY_DELAY_S', '60'))
+
+# Setup logger
+logger = setup_logger('daily_practice', 'daily_practice.log')
+
+# Errors that won't go away by retrying: the user blocked the bot, the chat is gone, ...
+PERMANENT_ERRORS = (Forbidden, BadRequest)
+
+_run_lock = asyncio.Lock()
+
+
+def today() -> str:
+    """Run date in UTC, matching the database timestamps."""
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def topic_for(user_id: int, run_date: str, topics: list[str]) -> str:
+    """Rotate each user through the topics, one per day."""
+    day = datetime.fromisoformat(run_date).toordinal()
+    return topics[(user_id + day) % len(topics)]
+
+
+def start_run(run_date: str) -> str:
+    """Create the run for a date if needed and return its status."""
+    try:
+        with get_db() as db:
+            db.execute('''
+                INSERT OR IGNORE INTO practice_runs (run_date, status) VALUES (?, 'running')
+            ''', (run_date,))
+            status = db.execute('''
+                SELECT status FROM practice_runs WHERE run_date = ?
+            ''', (run_date,)).fetchone()[0]
+            log_db_operation("SELECT", f"Practice run {run_date} status: {status}")
+            return status
+    except Exception as e:
+        logger.error(f"Error starting practice run: {e}")
+        raise
+
+
+def get_run_status(run_date: str) -> str | None:
+    """Status of the run for a date, or None if it never started."""
+    try:
+        with get_db() as db:
+            row = db.execute('''
+                SELECT status FROM practice_runs WHERE run_date = ?
+            ''', (run_date,)).fetchone()
+            return row[0] if row else None
+    except Exception as e:
+        logger.error(f"Error getting practice run status: {e}")
+        raise
+
+
+def finish_run(run_date: str):
+    try:
+        with get_db() as db:
+            db.execute('''
+                UPDATE practice_runs SET status = 'done', finished_at = CURRENT_TIMESTAMP
+                WHERE run_date = ?
+            ''', (run_date,))
+            log_db_operation("UPDATE", f"Practice run {run_date} finished")
+    except Exception as e:
+        logger.error(f"Error finishing practice run: {e}")
+        raise
+
+
+def get_pending_users(run_date: str, after_user_id: int, limit: int) -> list[tuple[int, str]]:
+    """Next page of opted-in (user_id, level) that have not received today's prompt, in user_id order."""
+    try:
+        with get_db() as db:
+            cursor = db.execute('''
+                SELECT u.user_id, u.level FROM user_levels u
+                LEFT JOIN practice_deliveries d
+                    ON d.run_date = ? AND d.user_id = u.user_id
+                WHERE d.user_id IS NULL AND u.user_id > ?
+                    AND u.user_id NOT IN (SELECT user_id FROM practice_opt_outs)
+                ORDER BY u.user_id
+                LIMIT ?
+            ''', (run_date, after_user_id, limit))
+            return cursor.fetchall()
+    except Exception as e:
+        logger.error(f"Error getting pending practice users: {e}")
+        raise
+
+
+def set_practice_opt_out(user_id: int, opted_out: bool):
+    """Stop or resume daily practice prompts for a user."""
+    try:
+        with get_db() as db:
+            if opted_out:
+                db.execute('''
+                    INSERT OR IGNORE INTO practice_opt_outs (user_id) VALUES (?)
+                ''', (user_id,))
+            else:
+                db.execute('''
+                    DELETE FROM practice_opt_outs WHERE user_id = ?
+                ''', (user_id,))
+            log_db_operation("UPDATE", f"User {user_id} daily practice {'off' if opted_out else 'on'}")
+    except Exception as e:
+        logger.error(f"Error setting daily practice opt-out: {e}")
+        raise
+
+
+def is_practice_opted_out(user_id: int) -> bool:
+    try:
+        with get_db() as db:
+            return db.execute('''
+                SELECT 1 FROM practice_opt_outs WHERE user_id = ?
+            ''', (user_id,)).fetchone() is not None
+    except Exception as e:
+        logger.error(f"Error getting daily practice opt-out: {e}")
+        raise
+
+
+def get_cached_questions(run_date: str) -> dict[tuple[str, str], str]:
+    try:
+        with get_db() as db:
+            cursor = db.execute('''
+                SELECT level, topic, question FROM practice_prompts WHERE run_date = ?
+            ''', (run_date,))
+            return {(level, topic): question for level, topic, question in cursor.fetchall()}
+    except Exception as e:
+        logger.error(f"Error getting practice questions: {e}")
+        raise
+
+
+def save_question(run_date: str, level: str, topic: str, question: str):
+    try:
+        with get_db() as db:
+            db.execute('''
+                INSERT OR IGNORE INTO practice_prompts (run_date, level, topic, question)
+                VALUES (?, ?, ?, ?)
+            ''', (run_date, level, topic, question))
+    except Exception as e:
+        logger.error(f"Error saving practice question: {e}")
+        raise
+
+
+def record_deliveries(run_date: str, deliveries: list[tuple[int, str]]):
+    """Checkpoint delivered (user_id, question) pairs and add the questions to their history."""
+    try:
+        with get_db() as db:
+            db.executemany('''
+                INSERT OR IGNORE INTO practice_deliveries (run_date, user_id) VALUES (?, ?)
+            ''', [(run_date, user_id) for user_id, _ in deliveries])
+            db.execute('''
+                UPDATE practice_runs SET delivered = delivered + ? WHERE run_date = ?
+            ''', (len(deliveries), run_date))
+            # Keep the question in history so the user's reply has context
+            db.executemany('''
+                INSERT INTO conversations (user_id, role, message) VALUES (?, 'assistant', ?)
+            ''', deliveries)
+            log_db_operation("INSERT", f"Recorded {len(deliveries)} practice deliveries for {run_date}")
+    except Exception as e:
+        logger.error(f"Error recording practice deliveries: {e}")
+        raise
+
+
+def record_undeliverable(run_date: str, user_ids: list[int]):
+    """Mark users whose chat rejected the prompt permanently, so the run doesn't retry them."""
+    try:
+        with get_db() as db:
+            db.executemany('''
+                INSERT OR IGNORE INTO practice_deliveries (run_date, user_id, status) VALUES (?, ?, 'failed')
+            ''', [(run_date, user_id) for user_id in user_ids])
+            log_db_operation("INSERT", f"Recorded {len(user_ids)} undeliverable practice prompts for {run_date}")
+    except Exception as e:
+        logger.error(f"Error recording undeliverable practice prompts: {e}")
+        raise
+
+
+async def _generate(level: str, topic: str, semaphore: asyncio.Semaphore) -> str | None:
+    async with semaphore:
+        response = await asyncio.to_thread(generate_topic_question, topic, level)
+    if response == TOPIC_QUESTION_FALLBACK or "AI:" not in response:
+        return None
+    return response.split("AI:")[1].strip()
+
+
+async def get_cohort_questions(run_date: str, cohorts: set[tuple[str, str]],
+                               cache: dict[tuple[str, str], str]) -> dict[tuple[str, str], str]:
+    """Questions for each (level, topic) cohort, generating and storing any that are missing."""
+    missing = sorted(cohort for cohort in cohorts if cohort not in cache)
+    if missing:
+        logger.info(f"Generating {len(missing)} practice questions for {run_date}")
+        semaphore = asyncio.Semaphore(PRACTICE_GENERATION_CONCURRENCY)
+        questions = await asyncio.gather(*(_generate(level, topic, semaphore) for level, topic in missing))
+        for (level, topic), question in zip(missing, questions):
+            if question is None:
+                logger.warning(f"Could not generate practice question for {level}/{topic}, skipping cohort")
+                continue
+            await asyncio.to_thread(save_question, run_date, level, topic, question)
+            cache[(level, topic)] = question
+    return cache
+
+
+def _send(user_id: int, topic: str, question: str) -> asyncio.Future:
+    # Failures are reported by _deliver_page, so the dispatcher doesn't log them too
+    text = f"🌞 Daily practice: {topic}\n\n{question}\n\n(Send /practice off to stop these daily questions.)"
+    return dispatcher.enqueue_text(user_id, text, BACKGROUND, log_failure=False)
+
+
+async def _deliver_page(run_date: str, sends: dict[asyncio.Future, tuple[int, str]]) -> tuple[int, int, int, bool]:
+    """Wait for a page of sends, recording each delivery as soon as it succeeds.
+
+    Returns (delivered, failed, undeliverable, aborted). Users whose chat
+    rejects the message permanently are recorded as undeliverable and not
+    retried; other failures are left pending for the next pass. The page is aborted when the
+    dispatcher cancels its queued sends on shutdown; sends already in flight
+    are still waited for and recorded. If the job itself is cancelled, the
+    remaining sends are cancelled and finished ones are still recorded before
+    the cancellation propagates.
+    """
+    pending = set(sends)
+    delivered = failed = undeliverable = 0
+    aborted = False
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            batch = []
+            rejected = []
+            for future in done:
+                if future.cancelled():
+                    aborted = True
+                elif isinstance(future.exception(), PERMANENT_ERRORS):
+                    rejected.append(sends[future][0])
+                    logger.info(f"Daily practice undeliverable to {sends[future][0]}: {future.exception()}")
+                elif future.exception():
+                    failed += 1
+                    logger.warning(f"Daily practice delivery to {sends[future][0]} failed: {future.exception()}")
+                else:
+                    batch.append(sends.pop(future))
+            # The writes complete in their thread even if the job is cancelled meanwhile
+            if batch:
+                delivered += len(batch)
+                await asyncio.to_thread(record_deliveries, run_date, batch)
+            if rejected:
+                undeliverable += len(rejected)
+                await asyncio.to_thread(record_undeliverable, run_date, rejected)
+    finally:
+        for future in pending:
+            future.cancel()
+        # Sends that completed but weren't collected before a cancellation
+        finished = [delivery for future, delivery in sends.items()
+                    if future.done() and not future.cancelled() and not future.exception()]
+        if finished:
+            record_deliveries(run_date, finished)
+    return delivered, failed, undeliverable, aborted
+
+
+async def _run_pass(run_date: str, topics: list[str],
+                    cache: dict[tuple[str, str], str]) -> tuple[int, int, int, int, bool]:
+    """Send the prompt to every pending user once.
+
+    Returns (delivered, failed, undeliverable, skipped, aborted).
+    """
+    after_user_id = 0
+    delivered = failed = undeliverable = skipped = 0
+    while True:
+        users = await asyncio.to_thread(get_pending_users, run_date, after_user_id, PRACTICE_PAGE_SIZE)
+        if not users:
+            break
+        if not dispatcher.running:
+            # Shutting down between pages
+            return delivered, failed, undeliverable, skipped, True
+        after_user_id = users[-1][0]
+
+        assignments = [(user_id, level, topic_for(user_id, run_date, topics)) for user_id, level in users]
+        await get_cohort_questions(run_date, {(level, topic) for _, level, topic in assignments}, cache)
+
+        sends = {}
+        for user_id, level, topic in assignments:
+            question = cache.get((level, topic))
+            if question is None:
+                skipped += 1
+                continue
+            sends[_send(user_id, topic, question)] = (user_id, question)
+
+        page_delivered, page_failed, page_undeliverable, aborted = await _deliver_page(run_date, sends)
+        delivered += page_delivered
+        failed += page_failed
+        undeliverable += page_undeliverable
+        if aborted:
+            return delivered, failed, undeliverable, skipped, True
+    return delivered, failed, undeliverable, skipped, False
+
+
+async def run_daily_practice(context) -> None:
+    """Job callback: send today's practice prompt to every user who hasn't had it yet.
+
+    Users are processed in pages ordered by user_id. One question is generated
+    per (level, topic) cohort and shared by everyone in it, and every delivery
+    is recorded as soon as it succeeds, so a restarted run picks up where it
+    stopped. Users whose delivery failed transiently are retried in further
+    passes, while users who blocked the bot or whose chat is gone are recorded
+    as undeliverable. The run is only marked done once every user is settled.
+    """
+    topics = context.job.data['topics']
+    if _run_lock.locked():
+        logger.info("Daily practice run already in progress")
+        return
+
+    async with _run_lock:
+        run_date = today()
+        if await asyncio.to_thread(start_run, run_date) == 'done':
+            logger.info(f"Daily practice for {run_date} already delivered")
+            return
+        logger.info(f"Starting daily practice run for {run_date}")
+
+        cache = await asyncio.to_thread(get_cached_questions, run_date)
+        for attempt in range(1, PRACTICE_MAX_PASSES + 1):
+            delivered, failed, undeliverable, skipped, aborted = await _run_pass(run_date, topics, cache)
+            logger.info(
+                f"Daily practice pass {attempt} for {run_date}: {delivered} delivered, "
+                f"{failed} failed, {undeliverable} undeliverable, {skipped} skipped, "
+                f"{len(cache)} cohort questions"
+            )
+            if aborted:
+                logger.warning(f"Daily practice run for {run_date} aborted, it will resume on the next start")
+                return
+            if not failed and not skipped:
+                await asyncio.to_thread(finish_run, run_date)
+                logger.info(f"Daily practice run for {run_date} finished")
+                return
+            if attempt < PRACTICE_MAX_PASSES:
+                await asyncio.sleep(PRACTICE_RETRY_DELAY_S)
+
+        # Left 'running' so the users still missing are retried when the bot restarts
+        logger.warning(f"Daily practice run for {run_date} incomplete after {PRACTICE_MAX_PASSES} passes")
+
+
+async def resume_daily_practice(context) -> None:
+    """Startup job: finish today's run if the bot stopped in the middle of it."""
+    if await asyncio.to_thread(get_run_status, today()) == 'running':
+        logger.info("Resuming interrupted daily practice run")
+        await run_daily_practice(context)
@@ -36,6 +36,89 @@ def init_db():
                     FOREIGN KEY (user_id) REFERENCES user_levels(user_id)
                 )
             ''')
+
+            # Learning analytics: incremental aggregates over the conversations table
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS analytics_cursor (
+                    name TEXT PRIMARY KEY,
+                    last_rowid INTEGER NOT NULL
+                )
+            ''')
+
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    user_id INTEGER PRIMARY KEY,
+                    messages INTEGER NOT NULL DEFAULT 0,
+                    words INTEGER NOT NULL DEFAULT 0,
+                    corrections INTEGER NOT NULL DEFAULT 0,
+                    first_message_at DATETIME,
+                    last_message_at DATETIME
+                )
+            ''')
+
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS user_daily_stats (
+                    user_id INTEGER NOT NULL,
+                    day TEXT NOT NULL,
+                    messages INTEGER NOT NULL DEFAULT 0,
+                    words INTEGER NOT NULL DEFAULT 0,
+                    corrections INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, day)
+                )
+            ''')
+
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS user_mistakes (
+                    user_id INTEGER NOT NULL,
+                    original TEXT NOT NULL,
+                    better TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    last_seen DATETIME,
+                    PRIMARY KEY (user_id, original, better)
+                )
+            ''')
+            db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_mistakes_count
+                ON user_mistakes (user_id, count DESC)
+            ''')
+
+            # Daily practice job: one run per day, questions per cohort and delivery checkpoints
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS practice_runs (
+                    run_date TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    delivered INTEGER NOT NULL DEFAULT 0,
+                    started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    finished_at DATETIME
+                )
+            ''')
+
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS practice_prompts (
+                    run_date TEXT NOT NULL,
+                    level TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    PRIMARY KEY (run_date, level, topic)
+                )
+            ''')
+
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS practice_deliveries (
+                    run_date TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'sent',
+                    delivered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (run_date, user_id)
+                )
+            ''')
+
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS practice_opt_outs (
+                    user_id INTEGER PRIMARY KEY,
+                    opted_out_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
             log_db_operation("INIT", f"Database initialized at {DATABASE_PATH}")
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
@@ -108,7 +191,7 @@ def get_conversation(user_id: int, limit: int = 10) -> list:
         with get_db() as db:
             cursor = db.execute('''
                 SELECT role, message FROM conversations
-                WHERE user_id = ?
+                WHERE user_id = ? AND role IN ('user', 'assistant')
                 ORDER BY timestamp DESC
                 LIMIT ?
             ''', (user_id, limit))
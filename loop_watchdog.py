@@ -0,0 +1,287 @@
+import asyncio
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from logger_config import setup_logger
+
+# Load environment variables
+load_dotenv()
+LAG_THRESHOLD_MS = float(os.getenv('LOOP_LAG_THRESHOLD_MS', '100'))
+CHECK_INTERVAL_MS = float(os.getenv('LOOP_WATCHDOG_INTERVAL_MS', '50'))
+REPORT_INTERVAL_S = float(os.getenv('LOOP_REPORT_INTERVAL_S', '300'))
+METRICS_FILE = os.getenv('LOOP_METRICS_FILE', 'logs/loop_metrics.json')  # empty to disable
+
+# Setup logger
+logger = setup_logger('loop_watchdog', 'loop_watchdog.log')
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# asyncio task -> (handler name, user id, update id) for handlers currently running
+_active_handlers: dict = {}
+
+
+def track_handler(func):
+    """Decorator that records which handler and update an asyncio task is serving."""
+    @functools.wraps(func)
+    async def wrapper(update, context, *args, **kwargs):
+        task = asyncio.current_task()
+        user = getattr(update, 'effective_user', None)
+        previous = _active_handlers.get(task)
+        _active_handlers[task] = (func.__name__, user.id if user else None, getattr(update, 'update_id', None))
+        try:
+            return await func(update, context, *args, **kwargs)
+        finally:
+            if previous is None:
+                _active_handlers.pop(task, None)
+            else:
+                _active_handlers[task] = previous
+
+    return wrapper
+
+
+def _is_project_frame(filename: str) -> bool:
+    path = os.path.abspath(filename)
+    return (
+        path.startswith(PROJECT_DIR)
+        and 'site-packages' not in path
+        and path != os.path.abspath(__file__)
+    )
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q / 100))]
+
+
+class LoopWatchdog:
+    """Measures event-loop lag and attributes stalls to the code that blocked the loop.
+
+    A heartbeat task measures how late the loop wakes up from short sleeps. A
+    separate thread notices when the heartbeat stops and captures the stack of
+    the loop thread while it is still blocked, together with the handler and
+    update being served at that moment.
+    """
+
+    def __init__(self, threshold_ms: float = LAG_THRESHOLD_MS, interval_ms: float = CHECK_INTERVAL_MS,
+                 report_interval_s: float = REPORT_INTERVAL_S, window: int = 1000,
+                 metrics_file: str | None = METRICS_FILE):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.report_interval = report_interval_s
+        self.metrics_file = metrics_file
+        self._lags = deque(maxlen=window)
+        self._loop = None
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._last_beat = 0.0
+        self._beat = 0
+        self._pending = None  # (beat number, capture) taken by the thread during a stall
+        self.reset()
+
+    def reset(self):
+        """Clear all collected metrics and offender statistics."""
+        self._lags.clear()
+        self.samples = 0
+        self.stalls = 0
+        self.blocked_ms_total = 0.0
+        self.max_lag_ms = 0.0
+        self.offenders: dict[str, dict] = {}
+        self._reported_stalls = 0
+
+    def start(self):
+        """Start monitoring the running event loop. Must be called from the loop thread."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopping.clear()
+        self._task = self._loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info(f"Loop watchdog started (threshold {self.threshold * 1000:.0f} ms, interval {self.interval * 1000:.0f} ms)")
+
+    async def stop(self):
+        """Stop monitoring and log a final top-offenders report."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._thread.join(timeout=1)
+        self._task = None
+        self._thread = None
+        self.log_report()
+        self.write_metrics()
+        logger.info("Loop watchdog stopped")
+
+    async def _heartbeat(self):
+        last_report = time.monotonic()
+        while True:
+            expected = self._loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self._loop.time() - expected)
+            with self._lock:
+                self._last_beat = time.monotonic()
+                beat = self._beat
+                self._beat += 1
+                pending, self._pending = self._pending, None
+
+            self.samples += 1
+            lag_ms = lag * 1000
+            self._lags.append(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag >= self.threshold:
+                capture = pending[1] if pending and pending[0] == beat else None
+                self._record_stall(lag_ms, capture)
+
+            if time.monotonic() - last_report >= self.report_interval:
+                last_report = time.monotonic()
+                self.write_metrics()
+                if self.stalls > self._reported_stalls:
+                    self.log_report()
+                    self._reported_stalls = self.stalls
+
+    def _watch(self):
+        """Runs in a separate thread: capture the loop thread's stack while it is blocked."""
+        poll = max(0.005, min(self.interval, self.threshold) / 2)
+        while not self._stopping.wait(poll):
+            with self._lock:
+                blocked_for = time.monotonic() - self._last_beat
+                beat = self._beat
+                already_captured = self._pending is not None and self._pending[0] == beat
+            if already_captured or blocked_for < self.interval + self.threshold:
+                continue
+            capture = self._capture()
+            if capture:
+                with self._lock:
+                    if self._beat == beat:
+                        self._pending = (beat, capture)
+
+    def _capture(self) -> dict | None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        stack = traceback.extract_stack(frame)
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        handler, user_id, update_id = _active_handlers.get(task, (None, None, None))
+
+        site = next((f for f in reversed(stack) if _is_project_frame(f.filename)), None)
+        leaf = stack[-1] if stack else None
+        return {
+            'handler': handler or (task.get_name() if task else 'unknown'),
+            'user_id': user_id,
+            'update_id': update_id,
+            'site': f"{os.path.basename(site.filename)}:{site.lineno} in {site.name}" if site else 'unknown',
+            'leaf': f"{os.path.basename(leaf.filename)}:{leaf.lineno} in {leaf.name}" if leaf else 'unknown',
+            'stack': ''.join(traceback.format_list(stack[-15:])),
+        }
+
+    def _record_stall(self, lag_ms: float, capture: dict | None):
+        self.stalls += 1
+        self.blocked_ms_total += lag_ms
+        if capture is None:
+            capture = {'handler': 'unattributed', 'user_id': None, 'update_id': None,
+                       'site': 'unknown', 'leaf': 'unknown', 'stack': ''}
+
+        key = f"{capture['handler']} @ {capture['site']}"
+        offender = self.offenders.get(key)
+        if offender is None:
+            offender = self.offenders[key] = {
+                'handler': capture['handler'], 'site': capture['site'], 'leaf': capture['leaf'],
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'stack': capture['stack'],
+            }
+            if capture['stack']:
+                logger.warning(f"New blocking call site {key}, stack:\n{capture['stack']}")
+        offender['count'] += 1
+        offender['total_ms'] += lag_ms
+        offender['max_ms'] = max(offender['max_ms'], lag_ms)
+        offender['last_user_id'] = capture['user_id']
+        offender['last_update_id'] = capture['update_id']
+
+        logger.warning(
+            f"Event loop blocked for {lag_ms:.0f} ms in {capture['handler']} "
+            f"(user {capture['user_id']}, update {capture['update_id']}) at {capture['site']}, leaf {capture['leaf']}"
+        )
+
+    def top_offenders(self, n: int = 5) -> list[dict]:
+        """Blocking call sites ordered by total time they kept the loop blocked."""
+        ranked = sorted(self.offenders.values(), key=lambda o: o['total_ms'], reverse=True)
+        return [{k: v for k, v in o.items() if k != 'stack'} for o in ranked[:n]]
+
+    def metrics(self) -> dict:
+        """Snapshot of loop-lag metrics over the recent window."""
+        lags = sorted(self._lags)
+        return {
+            'samples': self.samples,
+            'threshold_ms': self.threshold * 1000,
+            'lag_ms': {
+                'last': self._lags[-1] if self._lags else 0.0,
+                'mean': sum(lags) / len(lags) if lags else 0.0,
+                'p50': _percentile(lags, 50),
+                'p95': _percentile(lags, 95),
+                'p99': _percentile(lags, 99),
+                'max': self.max_lag_ms,
+            },
+            'stalls': self.stalls,
+            'blocked_ms_total': self.blocked_ms_total,
+        }
+
+    def write_metrics(self, n: int = 5):
+        """Write the metrics and top offenders as JSON to the metrics file, if one is configured.
+
+        The file is replaced atomically, so readers always see a complete snapshot.
+        """
+        if not self.metrics_file:
+            return
+        snapshot = {
+            'updated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            **self.metrics(),
+            'top_offenders': self.top_offenders(n),
+        }
+        try:
+            directory = os.path.dirname(self.metrics_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.metrics_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f, indent=2)
+            os.replace(tmp_path, self.metrics_file)
+        except OSError as e:
+            logger.error(f"Error writing loop metrics to {self.metrics_file}: {e}")
+
+    def log_report(self, n: int = 5):
+        """Log the current metrics and the top blocking call sites."""
+        metrics = self.metrics()
+        lag = metrics['lag_ms']
+        lines = [
+            f"Loop lag report: {metrics['stalls']} stalls, {metrics['blocked_ms_total']:.0f} ms blocked, "
+            f"lag p50 {lag['p50']:.1f} ms, p99 {lag['p99']:.1f} ms, max {lag['max']:.1f} ms"
+        ]
+        for i, offender in enumerate(self.top_offenders(n), 1):
+            lines.append(
+                f"  {i}. {offender['handler']} @ {offender['site']} (leaf {offender['leaf']}): "
+                f"{offender['count']} stalls, {offender['total_ms']:.0f} ms total, {offender['max_ms']:.0f} ms max"
+            )
+        logger.info('\n'.join(lines))
+
+
+# Shared watchdog instance used by the bot
+watchdog = LoopWatchdog()
@@ -1,4 +1,5 @@
 import os
+import asyncio
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
@@ -9,7 +10,14 @@ from speech_handler import process_voice_message
 from database import get_user_level, set_user_level, add_message, get_conversation, clear_conversation
 import signal
 import sys
-from utils import retry_on_timeout
+from loop_watchdog import watchdog, track_handler
+from outbound_dispatcher import dispatcher
+from analytics import process_new_messages, get_progress, format_progress, ANALYTICS_INTERVAL_S
+from daily_practice import (
+    run_daily_practice, resume_daily_practice, set_practice_opt_out, is_practice_opted_out,
+    DAILY_PRACTICE_ENABLED, DAILY_PRACTICE_TIME,
+)
+from datetime import time, timezone
 
 # Load environment variables
 load_dotenv()
@@ -25,6 +33,12 @@ TOPICS = [
     "Hobbies", "Culture", "Education", "Environment"
 ]
 
+async def clear_history(user_id: int) -> None:
+    """Clear a user's conversation history without losing it from their progress."""
+    # Fold rows the analytics job hasn't seen yet into the summaries before deleting them
+    await asyncio.to_thread(process_new_messages)
+    await asyncio.to_thread(clear_conversation, user_id)
+
 # Command handlers
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a welcome message when the command /start is issued."""
@@ -40,15 +54,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    clear_conversation(user_id)  # Clear any previous conversation
+    await clear_history(user_id)  # Clear any previous conversation
     logger.info(f"Cleared previous conversation for user {user_id}")
     
-    await update.message.reply_text(
+    await dispatcher.send_text(
+        update.effective_chat.id,
         "Welcome to English Tutor Bot! I'll chat with you in English and help improve your language skills.\n\n"
         "Please select your English level:",
         reply_markup=reply_markup
     )
-    await update.message.reply_text(
+    await dispatcher.send_text(
+        update.effective_chat.id,
         "You can use /topic to choose a conversation topic at any time!"
     )
 
@@ -63,10 +79,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     - Send me a voice message and I'll listen, respond, and help improve your speaking
     - Use /topic to choose a specific conversation topic
     - Use /level to change your proficiency level
+    - Use /progress to see your learning progress
+    - Use /practice off or /practice on to stop or resume daily practice questions
     - Use /clear to start a new conversation
     - Use /help to see this message again
     """
-    await update.message.reply_text(help_text)
+    await dispatcher.send_text(update.effective_chat.id, help_text)
 
 async def level_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Change user's English level."""
@@ -80,14 +98,45 @@ async def level_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         [InlineKeyboardButton("Advanced", callback_data="level_advanced")],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("Select your English level:", reply_markup=reply_markup)
+    await dispatcher.send_text(update.effective_chat.id, "Select your English level:", reply_markup=reply_markup)
 
 async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Clear conversation history."""
     user_id = update.effective_user.id
     logger.info(f"User {user_id} cleared conversation history")
-    clear_conversation(user_id)
-    await update.message.reply_text("Conversation history cleared. Let's start a new chat!")
+    await clear_history(user_id)
+    await dispatcher.send_text(update.effective_chat.id, "Conversation history cleared. Let's start a new chat!")
+
+async def progress_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the user's learning progress."""
+    user_id = update.effective_user.id
+    logger.info(f"User {user_id} requested progress")
+    # Fold in at most one batch of rows added since the last analytics job
+    await asyncio.to_thread(process_new_messages, max_batches=1)
+    progress = await asyncio.to_thread(get_progress, user_id)
+    await dispatcher.send_text(update.effective_chat.id, format_progress(progress))
+
+async def practice_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Turn daily practice questions on or off."""
+    user_id = update.effective_user.id
+    choice = context.args[0].lower() if context.args else None
+    logger.info(f"User {user_id} sent /practice {choice}")
+    if choice in ('on', 'off'):
+        await asyncio.to_thread(set_practice_opt_out, user_id, choice == 'off')
+        text = ("Daily practice questions are off. Send /practice on to get them again."
+                if choice == 'off' else "Daily practice questions are on. See you tomorrow!")
+    else:
+        opted_out = await asyncio.to_thread(is_practice_opted_out, user_id)
+        text = (f"Daily practice questions are {'off' if opted_out else 'on'} for you. "
+                "Send /practice on or /practice off to change this.")
+    await dispatcher.send_text(update.effective_chat.id, text)
+
+async def update_analytics(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Periodic job that keeps the analytics summary tables up to date."""
+    try:
+        await asyncio.to_thread(process_new_messages)
+    except Exception as e:
+        log_error(logger, f"Analytics update failed: {str(e)}")
 
 # Add this new command handler
 async def topic_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -100,7 +149,8 @@ async def topic_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         one_time_keyboard=True,
         resize_keyboard=True
     )
-    await update.message.reply_text(
+    await dispatcher.send_text(
+        update.effective_chat.id,
         "Choose a topic you'd like to discuss:",
         reply_markup=reply_markup
     )
@@ -118,10 +168,9 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         set_user_level(user_id, level)
         await query.edit_message_text(f"Your level has been set to: {level.capitalize()}. Let's practice your English!")
 
-@retry_on_timeout(max_retries=3)
 async def send_message_with_retry(update, text):
-    """Send message with retry on timeout"""
-    await update.message.reply_text(text)
+    """Send message through the outbound dispatcher, which retries on timeout"""
+    return await dispatcher.send_text(update.effective_chat.id, text)
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle user text messages."""
@@ -174,6 +223,9 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             
             # Add AI response to conversation history
             add_message(user_id, "assistant", ai_part)
+            if "Better:" in correction_part:
+                # Stored for analytics; not sent back to the model as history
+                add_message(user_id, "correction", correction_part)
             
             await send_message_with_retry(update, formatted_response)
         else:
@@ -207,7 +259,9 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         level = get_user_level(user_id)
         
         # First, let the user know we're processing their audio
-        processing_msg = await update.message.reply_text("Processing your voice message...")
+        chat_id = update.effective_chat.id
+        # Deleted below, so it must not be merged with any other queued reply
+        processing_msg = await dispatcher.send_text(chat_id, "Processing your voice message...", merge=False)
         
         # Get the voice message file
         voice_file = await update.message.voice.get_file()
@@ -228,21 +282,22 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             ai_response = result.split("AI:")[1].split("\n\nCorrected:")[0].strip()
             add_message(user_id, "assistant", ai_response)
         
-        # Delete the processing message
-        await context.bot.delete_message(chat_id=update.message.chat_id, 
-                                       message_id=processing_msg.message_id)
+        # Delete the processing message; queued in order before the replies below
+        dispatcher.enqueue(chat_id, 'delete_message', message_id=processing_msg.message_id)
         
         # Send text response
-        await update.message.reply_text(result)
+        await dispatcher.send_text(chat_id, result)
         
         # If there's a correction, send the corrected pronunciation as voice
         if corrected_audio_path:
             logger.info(f"Generated correction audio for user {user_id}")
             with open(corrected_audio_path, 'rb') as audio:
-                await update.message.reply_voice(
-                    voice=audio,
-                    caption="Here's how to pronounce it correctly 🎯"
-                )
+                voice = audio.read()
+            await dispatcher.send_voice(
+                chat_id,
+                voice,
+                caption="Here's how to pronounce it correctly 🎯"
+            )
             os.remove(corrected_audio_path)  # Clean up the correction audio file
         
         # Clean up the original file
@@ -253,7 +308,8 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     except Exception as e:
         log_error(logger, f"Error handling voice from user {user_id}: {str(e)}")
         try:
-            await update.message.reply_text(
+            await dispatcher.send_text(
+                update.effective_chat.id,
                 "I'm sorry, I had trouble processing your voice message. Please try again."
             )
         except:
@@ -264,6 +320,50 @@ def signal_handler(signum, frame):
     logger.info("Received shutdown signal. Stopping bot...")
     sys.exit(0)
 
+async def post_init(application: Application) -> None:
+    """Start background services once the application is initialized."""
+    watchdog.start()
+    await dispatcher.start(application.bot)
+
+async def post_shutdown(application: Application) -> None:
+    """Stop background services on shutdown."""
+    await dispatcher.stop()
+    await watchdog.stop()
+
+def register_handlers(application: Application) -> None:
+    """Register all command and message handlers on the application."""
+    application.add_handler(CommandHandler("start", track_handler(start)))
+    application.add_handler(CommandHandler("help", track_handler(help_command)))
+    application.add_handler(CommandHandler("level", track_handler(level_command)))
+    application.add_handler(CommandHandler("clear", track_handler(clear_command)))
+    application.add_handler(CommandHandler("topic", track_handler(topic_command)))
+    application.add_handler(CommandHandler("progress", track_handler(progress_command)))
+    application.add_handler(CommandHandler("practice", track_handler(practice_command)))
+    application.add_handler(CallbackQueryHandler(track_handler(button)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, track_handler(handle_text)))
+    application.add_handler(MessageHandler(filters.VOICE, track_handler(handle_voice)))
+    logger.info("All handlers registered")
+
+def register_jobs(application: Application) -> None:
+    """Schedule background jobs on the application's JobQueue."""
+    if application.job_queue is None:
+        logger.warning("JobQueue not available, analytics will only update on /progress and daily practice is disabled")
+        return
+    application.job_queue.run_repeating(update_analytics, interval=ANALYTICS_INTERVAL_S, first=10)
+
+    if DAILY_PRACTICE_ENABLED:
+        hour, minute = map(int, DAILY_PRACTICE_TIME.split(':'))
+        job_data = {'topics': TOPICS}
+        application.job_queue.run_daily(
+            run_daily_practice,
+            time=time(hour, minute, tzinfo=timezone.utc),
+            data=job_data,
+            name='daily_practice'
+        )
+        # Finish a run that was interrupted by a restart
+        application.job_queue.run_once(resume_daily_practice, when=30, data=job_data, name='resume_daily_practice')
+    logger.info("Background jobs scheduled")
+
 def main() -> None:
     """Start the bot."""
     try:
@@ -275,19 +375,18 @@ def main() -> None:
         logger.info("Starting English Tutor Bot...")
         
         # Create the Application
-        application = Application.builder().token(TOKEN).build()
+        application = (
+            Application.builder()
+            .token(TOKEN)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
         logger.info("Bot application created")
 
         # Add handlers
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CommandHandler("level", level_command))
-        application.add_handler(CommandHandler("clear", clear_command))
-        application.add_handler(CommandHandler("topic", topic_command))
-        application.add_handler(CallbackQueryHandler(button))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
-        application.add_handler(MessageHandler(filters.VOICE, handle_voice))
-        logger.info("All handlers registered")
+        register_handlers(application)
+        register_jobs(application)
 
         # Start the Bot
         logger.info("Bot is starting polling...")
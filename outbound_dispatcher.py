@@ -0,0 +1,349 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from datetime import timedelta
+from dotenv import load_dotenv
+from telegram.error import RetryAfter
+from logger_config import setup_logger
+from utils import retry_on_timeout
+
+# Load environment variables
+load_dotenv()
+GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+MAX_IN_FLIGHT = int(os.getenv('TELEGRAM_MAX_IN_FLIGHT', '16'))
+
+# Setup logger
+logger = setup_logger('outbound_dispatcher', 'outbound_dispatcher.log')
+
+# Priorities: interactive replies always go out before background notifications
+INTERACTIVE = 0
+BACKGROUND = 1
+
+MAX_MESSAGE_LENGTH = 4096
+MERGE_SEPARATOR = "\n\n"
+PRUNE_INTERVAL_S = 30  # how often idle per-chat state is dropped
+
+
+class _TokenBucket:
+    """Token bucket rate limiter on the monotonic clock."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Outgoing:
+    """A queued Bot API call and the future its caller is waiting on."""
+
+    __slots__ = ('method', 'kwargs', 'priority', 'future', 'merge')
+
+    def __init__(self, method: str, kwargs: dict, priority: int, future: asyncio.Future, merge: bool = True):
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = future
+        self.merge = merge
+
+    @property
+    def mergeable(self) -> bool:
+        # Only plain text messages without markup or other options can be combined
+        return self.merge and self.method == 'send_message' and set(self.kwargs) == {'chat_id', 'text'}
+
+
+class _ChatQueue:
+    """Pending calls for one chat, with its own rate limit."""
+
+    def __init__(self, chat_id: int, rate: float, burst: int):
+        self.chat_id = chat_id
+        self.pending = (deque(), deque())  # indexed by priority
+        self.bucket = _TokenBucket(rate, burst)
+        self.blocked_until = 0.0
+        self.busy = False
+        self.schedule_seq = None  # heap entry currently valid for this chat
+
+    def __bool__(self):
+        return any(self.pending)
+
+    def is_idle(self, now: float) -> bool:
+        """True once dropping this chat's state can't loosen its rate limit."""
+        return (
+            not self.busy and not self
+            and self.blocked_until <= now
+            and self.bucket.is_full(now)
+        )
+
+    def head_priority(self) -> int:
+        return INTERACTIVE if self.pending[INTERACTIVE] else BACKGROUND
+
+    def discard_cancelled(self):
+        """Drop calls whose caller cancelled them before they were sent."""
+        for queue in self.pending:
+            kept = [item for item in queue if not item.future.cancelled()]
+            if len(kept) < len(queue):
+                queue.clear()
+                queue.extend(kept)
+
+    def pop_batch(self) -> list[_Outgoing]:
+        """Take the next call, merging adjacent plain text messages of the same priority."""
+        queue = self.pending[self.head_priority()]
+        batch = [queue.popleft()]
+        if batch[0].mergeable:
+            length = len(batch[0].kwargs['text'])
+            while queue and queue[0].mergeable:
+                extra = len(MERGE_SEPARATOR) + len(queue[0].kwargs['text'])
+                if length + extra > MAX_MESSAGE_LENGTH:
+                    break
+                length += extra
+                batch.append(queue.popleft())
+        return batch
+
+    def requeue(self, batch: list[_Outgoing]):
+        """Put a batch back at the front of its queue, keeping the original order."""
+        for item in reversed(batch):
+            self.pending[item.priority].appendleft(item)
+
+
+def _log_failure(future: asyncio.Future):
+    # Only attached to fire-and-forget calls; awaited calls report failures to their caller
+    if not future.cancelled() and future.exception():
+        logger.error(f"Outbound message failed: {future.exception()}")
+
+
+class OutboundDispatcher:
+    """Queues outbound Bot API calls and sends them within Telegram's flood limits.
+
+    Calls are queued per chat and released through a per-chat and a global
+    token bucket. Interactive replies are sent before background
+    notifications, adjacent plain text messages to the same chat are merged
+    into one, and RetryAfter responses reschedule the chat instead of failing.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 chat_burst: int = CHAT_BURST, max_in_flight: int = MAX_IN_FLIGHT):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_in_flight = max_in_flight
+        self._bot = None
+        self._worker = None
+        self.stats = {'sent': 0, 'merged': 0, 'retry_after': 0, 'failed': 0}
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None
+
+    async def start(self, bot):
+        """Start sending through the given Bot. Must be called from the event loop."""
+        if self._worker is not None:
+            return
+        self._bot = bot
+        self._chats: dict[int, _ChatQueue] = {}
+        self._ready = []    # (priority, seq, chat_id) for chats that may send now
+        self._waiting = []  # (ready_at, seq, chat_id) for rate-limited chats
+        self._seq = itertools.count()
+        self._global = _TokenBucket(self.global_rate, self.global_rate)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._wakeup = asyncio.Event()
+        self._deliveries = set()
+        self._last_prune = time.monotonic()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Outbound dispatcher started (global {self.global_rate}/s, "
+            f"per chat {self.chat_rate}/s burst {self.chat_burst})"
+        )
+
+    async def stop(self, timeout: float = 10):
+        """Flush queued calls for up to `timeout` seconds, then stop."""
+        if self._worker is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (any(self._chats.values()) or self._deliveries) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        for chat in self._chats.values():
+            for queue in chat.pending:
+                for item in queue:
+                    item.future.cancel()
+        logger.info(f"Outbound dispatcher stopped: {self.stats}")
+
+    def enqueue(self, chat_id: int, method: str, priority: int = INTERACTIVE,
+                log_failure: bool = True, merge: bool = True, **kwargs) -> asyncio.Future:
+        """Queue a Bot method call and return a future for its result.
+
+        Failures are logged here unless `log_failure` is False, which callers
+        that consume the future themselves should pass. Pass `merge=False`
+        for messages that will be edited or deleted later, so they are never
+        combined with other text.
+        """
+        if self._worker is None:
+            raise RuntimeError("Outbound dispatcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        if log_failure:
+            future.add_done_callback(_log_failure)
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _ChatQueue(chat_id, self.chat_rate, self.chat_burst)
+        chat.pending[priority].append(_Outgoing(method, {'chat_id': chat_id, **kwargs}, priority, future, merge))
+        self._schedule(chat)
+        return future
+
+    def enqueue_text(self, chat_id: int, text: str, priority: int = INTERACTIVE,
+                     log_failure: bool = True, **kwargs) -> asyncio.Future:
+        """Queue a text message without waiting for it to be sent."""
+        return self.enqueue(chat_id, 'send_message', priority, log_failure, text=text, **kwargs)
+
+    async def send_text(self, chat_id: int, text: str, priority: int = INTERACTIVE, **kwargs):
+        """Send a text message and return the sent Message."""
+        return await self.enqueue_text(chat_id, text, priority, log_failure=False, **kwargs)
+
+    async def send_voice(self, chat_id: int, voice, priority: int = INTERACTIVE, **kwargs):
+        """Send a voice message and return the sent Message."""
+        return await self.enqueue(chat_id, 'send_voice', priority, log_failure=False, voice=voice, **kwargs)
+
+    def _schedule(self, chat: _ChatQueue):
+        """Put a chat on the ready or waiting heap if it has something to send."""
+        if chat.busy or not chat:
+            return
+        now = time.monotonic()
+        seq = next(self._seq)
+        chat.schedule_seq = seq
+        ready_at = max(chat.blocked_until, now + chat.bucket.delay(now))
+        if ready_at <= now:
+            heapq.heappush(self._ready, (chat.head_priority(), seq, chat.chat_id))
+        else:
+            heapq.heappush(self._waiting, (ready_at, seq, chat.chat_id))
+        self._wakeup.set()
+
+    def _promote_waiting(self, now: float):
+        while self._waiting and self._waiting[0][0] <= now:
+            _, seq, chat_id = heapq.heappop(self._waiting)
+            chat = self._chats.get(chat_id)
+            if chat is not None and chat.schedule_seq == seq:
+                heapq.heappush(self._ready, (chat.head_priority(), seq, chat_id))
+
+    def _prune_idle(self, now: float):
+        """Drop chats whose queue is empty, bucket is full and block has expired.
+
+        Chats are kept after their queue empties so that back-to-back awaited
+        sends still see the per-chat rate limit and any RetryAfter block.
+        """
+        if now - self._last_prune < PRUNE_INTERVAL_S:
+            return
+        self._last_prune = now
+        for chat_id in [chat_id for chat_id, chat in self._chats.items() if chat.is_idle(now)]:
+            del self._chats[chat_id]
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            self._prune_idle(now)
+            self._promote_waiting(now)
+            if not self._ready:
+                timeout = self._waiting[0][0] - now if self._waiting else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = self._global.delay(now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            await self._slots.acquire()
+            # The heap may have changed while waiting for a free slot
+            self._promote_waiting(time.monotonic())
+            chat = None
+            while self._ready:
+                _, seq, chat_id = heapq.heappop(self._ready)
+                candidate = self._chats.get(chat_id)
+                if candidate is None or candidate.schedule_seq != seq or candidate.busy:
+                    continue
+                candidate.discard_cancelled()
+                if candidate:
+                    chat = candidate
+                    break
+            if chat is None:
+                self._slots.release()
+                continue
+
+            chat.schedule_seq = None
+            batch = chat.pop_batch()
+            now = time.monotonic()
+            self._global.take(now)
+            chat.bucket.take(now)
+            chat.busy = True
+            task = asyncio.create_task(self._deliver(chat, batch))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    @retry_on_timeout(max_retries=3)
+    async def _call(self, method: str, kwargs: dict):
+        return await getattr(self._bot, method)(**kwargs)
+
+    async def _deliver(self, chat: _ChatQueue, batch: list[_Outgoing]):
+        try:
+            kwargs = batch[0].kwargs
+            if len(batch) > 1:
+                kwargs = {**kwargs, 'text': MERGE_SEPARATOR.join(item.kwargs['text'] for item in batch)}
+            result = await self._call(batch[0].method, kwargs)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            chat.blocked_until = time.monotonic() + retry_after
+            chat.requeue(batch)
+            self.stats['retry_after'] += 1
+            logger.warning(f"Flood control for chat {chat.chat_id}, retrying in {retry_after}s")
+        except Exception as e:
+            self.stats['failed'] += len(batch)
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        else:
+            self.stats['sent'] += 1
+            self.stats['merged'] += len(batch) - 1
+            if len(batch) > 1:
+                logger.info(f"Merged {len(batch)} messages for chat {chat.chat_id}")
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_result(result)
+        finally:
+            chat.busy = False
+            self._slots.release()
+            self._schedule(chat)
+
+
+# Shared dispatcher instance used by the bot
+dispatcher = OutboundDispatcher()
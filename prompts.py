@@ -0,0 +1,168 @@
+import functools
+import threading
+from string import Template
+from logger_config import setup_logger
+
+# Setup logger
+logger = setup_logger('prompts', 'prompts.log')
+
+# Every template is split into a static prefix and a variable suffix.
+# The prefix must never contain placeholders: it is sent byte-for-byte
+# identical on every request so the provider can reuse its cached prefix,
+# and everything that changes per user (level, topic) goes at the end.
+
+CONVERSATION_PREFIX = """You are a friendly English tutor having a conversation with an English learner.
+When responding:
+1. Reply naturally to keep the conversation flowing
+2. Always include:
+   - A response to what they said
+   - A relevant follow-up question to keep the conversation going
+3. If there are language mistakes:
+   - Identify what could be improved
+   - Suggest more natural alternatives
+   - Explain why the changes make it more natural (briefly)
+4. Use common, everyday expressions appropriate for their level
+5. Match the formality level to the context
+6. Only correct if the change helps them improve their English
+7. Consider the conversation context when responding
+
+Format your response as:
+AI: [your response to their message + a follow-up question]
+
+Corrected: [if needed, explain improvements and provide better alternatives]
+Example correction format:
+- Original: "I am very tired because I slept very late yesterday"
+- Better: "I'm really tired because I went to bed late last night"
+- Why: Using "I'm" is more natural in conversation, and "went to bed" is the common way to express sleeping time
+"""
+
+CONVERSATION_SUFFIX = """
+The learner's English level is: $level"""
+
+TOPIC_QUESTION_PREFIX = """You are a friendly English tutor starting a conversation with an English learner.
+Generate an engaging, level-appropriate question to start the conversation.
+Make it natural and conversational, as if you're chatting with a friend.
+
+Format your response as:
+AI: [your conversation-starting question]
+"""
+
+TOPIC_QUESTION_SUFFIX = """
+The topic is: $topic
+The learner's English level is: $level"""
+
+VOICE_PREFIX = """You are a friendly English tutor helping an English learner with pronunciation and speaking.
+When responding:
+1. Acknowledge what you heard
+2. Provide a natural response
+3. If there are pronunciation issues, provide ONLY the corrected version of what they said with phonetic spelling
+
+Format your response as:
+I heard: [transcribed text]
+
+AI: [your response]
+
+Corrected: [ONLY the user's exact words with phonetic spelling for correction, no additional explanations]
+"""
+
+VOICE_SUFFIX = """
+The learner's English level is: $level"""
+
+
+class PromptTemplate:
+    """A system prompt with a cache-friendly static prefix and a variable suffix."""
+
+    def __init__(self, name: str, prefix: str, suffix: str):
+        if '$' in prefix:
+            raise ValueError(f"Prompt '{name}' has placeholders in its static prefix")
+        self.name = name
+        self.prefix = prefix
+        self.suffix = Template(suffix)
+        # Validate the suffix once so a bad template fails at startup, not mid-request
+        if not self.suffix.is_valid():
+            raise ValueError(f"Prompt '{name}' has an invalid placeholder in its suffix")
+        self.fields = tuple(self.suffix.get_identifiers())
+
+    def render(self, **params) -> str:
+        """Render the full prompt; raises KeyError if a field is missing."""
+        return self.prefix + self.suffix.substitute(**params)
+
+
+_registry: dict[str, PromptTemplate] = {}
+
+
+def register_prompt(name: str, prefix: str, suffix: str) -> PromptTemplate:
+    """Compile a template and add it to the registry."""
+    template = PromptTemplate(name, prefix, suffix)
+    _registry[name] = template
+    logger.info(f"Registered prompt '{name}' ({len(prefix)} char static prefix, fields: {', '.join(template.fields)})")
+    return template
+
+
+def get_prompt(name: str) -> PromptTemplate:
+    """Get a registered prompt template by name."""
+    try:
+        return _registry[name]
+    except KeyError:
+        raise KeyError(f"Unknown prompt template: {name}") from None
+
+
+@functools.lru_cache(maxsize=256)
+def _render_cached(name: str, params: tuple) -> str:
+    return get_prompt(name).render(**dict(params))
+
+
+def render_prompt(name: str, **params) -> str:
+    """Render a registered prompt, reusing the string for repeated parameters."""
+    return _render_cached(name, tuple(sorted(params.items())))
+
+
+# Usage accounting, keyed by prompt name
+_usage_lock = threading.Lock()
+_usage_stats: dict[str, dict] = {}
+
+
+def record_usage(name: str, usage) -> None:
+    """Record prompt and cached token counts from an OpenAI response's usage field."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+
+    with _usage_lock:
+        stats = _usage_stats.setdefault(name, {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0})
+        stats['requests'] += 1
+        stats['prompt_tokens'] += prompt_tokens
+        stats['cached_tokens'] += cached_tokens
+        ratio = stats['cached_tokens'] / stats['prompt_tokens'] if stats['prompt_tokens'] else 0.0
+
+    logger.info(
+        f"Prompt '{name}' usage: {prompt_tokens} prompt tokens, {cached_tokens} cached "
+        f"(running cached ratio {ratio:.1%})"
+    )
+
+
+def get_usage_stats() -> dict[str, dict]:
+    """Return a snapshot of token usage per prompt, including the cached-token ratio."""
+    with _usage_lock:
+        snapshot = {}
+        for name, stats in _usage_stats.items():
+            prompt_tokens = stats['prompt_tokens']
+            snapshot[name] = {
+                **stats,
+                'cached_ratio': stats['cached_tokens'] / prompt_tokens if prompt_tokens else 0.0,
+            }
+        return snapshot
+
+
+def reset_usage_stats() -> None:
+    """Clear the usage counters, e.g. between benchmark scenarios."""
+    with _usage_lock:
+        _usage_stats.clear()
+
+
+# Precompile all templates once at import time
+register_prompt('conversation', CONVERSATION_PREFIX, CONVERSATION_SUFFIX)
+register_prompt('topic_question', TOPIC_QUESTION_PREFIX, TOPIC_QUESTION_SUFFIX)
+register_prompt('voice', VOICE_PREFIX, VOICE_SUFFIX)
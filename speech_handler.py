@@ -6,6 +6,8 @@ from gtts import gTTS
 import tempfile
 from logger_config import setup_logger
 from utils import retry_on_timeout
+from prompts import render_prompt, record_usage
+from audio_preprocessing import preprocess_audio
 
 # Setup logger
 logger = setup_logger('speech_handler', 'speech_handler.log')
@@ -40,8 +42,8 @@ def process_voice_message(file_path: str, level: str) -> tuple[str, str | None]:
     try:
         logger.info(f"Processing voice message - file: {file_path}, level: {level}")
         
-        # Convert ogg to wav
-        audio = AudioSegment.from_ogg(file_path)
+        # Convert ogg to a trimmed, mono, 16 kHz wav for faster recognition
+        audio = preprocess_audio(AudioSegment.from_ogg(file_path))
         wav_path = tempfile.mktemp(suffix='.wav')
         audio.export(wav_path, format="wav")
         logger.info("Converted audio to WAV format")
@@ -68,22 +70,12 @@ def process_voice_message(file_path: str, level: str) -> tuple[str, str | None]:
             response = client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[
-                    {"role": "system", "content": f"""You are a friendly English tutor helping a {level}-level learner with pronunciation and speaking.
-                    When responding:
-                    1. Acknowledge what you heard
-                    2. Provide a natural response
-                    3. If there are pronunciation issues, provide ONLY the corrected version of what they said with phonetic spelling
-                    
-                    Format your response as:
-                    I heard: [transcribed text]
-                    
-                    AI: [your response]
-                    
-                    Corrected: [ONLY the user's exact words with phonetic spelling for correction, no additional explanations]"""},
+                    {"role": "system", "content": render_prompt('voice', level=level)},
                     {"role": "user", "content": transcribed_text}
                 ]
             )
             logger.info("Received response from OpenAI API")
+            record_usage('voice', response.usage)
             
             result = response.choices[0].message.content
             
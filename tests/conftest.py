@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules read these at import time; keep the default database out of the working tree
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='tutor-tests-'), 'bot.db'))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Point the database module at a fresh database file for one test."""
+    import database
+    monkeypatch.setattr(database, 'DATABASE_PATH', str(tmp_path / 'bot.db'))
+    database.init_db()
+    return database
@@ -0,0 +1,90 @@
+import asyncio
+from datetime import date, timedelta
+
+import analytics
+from analytics import extract_corrections, mistake_phrases, process_new_messages, get_progress, format_progress
+
+CORRECTION = """Corrected:
+- Original: "I goed to school yesterday"
+- Better: "I went to school yesterday"
+- Why: "go" is irregular
+- Original: I like it
+- Better: I like it
+"""
+
+
+def add_row(db, user_id, role, message, timestamp):
+    with db.get_db() as conn:
+        conn.execute(
+            'INSERT INTO conversations (user_id, role, message, timestamp) VALUES (?, ?, ?, ?)',
+            (user_id, role, message, timestamp),
+        )
+
+
+def test_extract_corrections_skips_unchanged_sentences():
+    assert extract_corrections(CORRECTION) == [("I goed to school yesterday", "I went to school yesterday")]
+    assert extract_corrections("AI: Nice!\n- Better: orphaned line") == []
+
+
+def test_mistake_phrases_are_word_level_differences():
+    assert mistake_phrases("I goed to school", "I went to school") == [("goed", "went")]
+    assert mistake_phrases("She like apples", "She likes the apples") == [("like", "likes the")]
+    assert mistake_phrases("I want", "I want to") == [("", "to")]
+    # Whole rewrites are style changes, not recurring mistakes
+    assert mistake_phrases("a b c d e f", "u v w x y z") == []
+
+
+def test_cursor_only_processes_new_rows(db):
+    db.add_message(1, 'user', 'one two three')
+    db.add_message(1, 'assistant', 'ignored for stats')
+    db.add_message(1, 'correction', CORRECTION)
+    assert process_new_messages(batch_size=2) == 3
+    assert process_new_messages() == 0
+
+    db.add_message(1, 'user', 'four five')
+    assert process_new_messages() == 1
+    progress = get_progress(1)
+    assert (progress['messages'], progress['words'], progress['corrections']) == (2, 5, 1)
+    assert progress['top_mistakes'] == [{'original': 'goed', 'better': 'went', 'count': 1}]
+
+
+def test_max_batches_limits_work(db):
+    for i in range(5):
+        db.add_message(1, 'user', f'message {i}')
+    assert process_new_messages(batch_size=2, max_batches=1) == 2
+    assert process_new_messages(batch_size=2) == 3
+
+
+def test_progress_buckets_this_and_last_week(db):
+    today = date(2026, 3, 20)
+    add_row(db, 1, 'user', 'this week message', f"{today - timedelta(days=6)} 10:00:00")
+    add_row(db, 1, 'user', 'also this week', f"{today} 09:00:00")
+    add_row(db, 1, 'user', 'last week', f"{today - timedelta(days=7)} 23:59:59")
+    add_row(db, 1, 'correction', CORRECTION, f"{today - timedelta(days=13)} 08:00:00")
+    add_row(db, 1, 'user', 'long ago', f"{today - timedelta(days=30)} 08:00:00")
+    process_new_messages()
+
+    progress = get_progress(1, today)
+    assert progress['messages'] == 4
+    assert progress['this_week'] == {'messages': 2, 'words_per_message': 3.0, 'corrections': 0}
+    assert progress['last_week'] == {'messages': 1, 'words_per_message': 2.0, 'corrections': 1}
+    assert '"goed" → "went" (1x)' in format_progress(progress)
+
+
+def test_progress_survives_clearing_history(db):
+    import main
+
+    db.add_message(7, 'user', 'I goed home')
+    db.add_message(7, 'correction', CORRECTION)
+    # Rows the analytics job hasn't reached yet must still be counted
+    asyncio.run(main.clear_history(7))
+
+    assert db.get_conversation(7) == []
+    progress = get_progress(7)
+    assert (progress['messages'], progress['corrections']) == (1, 1)
+    assert analytics.process_new_messages() == 0
+    assert get_progress(7)['messages'] == 1
+
+
+def test_no_progress_message():
+    assert "don't have any progress" in format_progress(None)
@@ -0,0 +1,148 @@
+import asyncio
+import types
+from collections import Counter
+
+import pytest
+from telegram.error import Forbidden, NetworkError
+
+import daily_practice
+from outbound_dispatcher import OutboundDispatcher
+
+TOPICS = ["Travel", "Music"]
+
+
+class FakeBot:
+    """Counts practice prompts per chat.
+
+    `fail` maps chat ids to the exception their sends raise. After `block_after`
+    sends, further sends wait until `release` is set.
+    """
+
+    def __init__(self, fail=None, block_after=None):
+        self.sent = Counter()
+        self.fail = fail or {}
+        self.block_after = block_after
+        self.blocked = 0
+        self.release = asyncio.Event()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.fail:
+            raise self.fail[chat_id]
+        if self.block_after is not None and sum(self.sent.values()) + self.blocked >= self.block_after:
+            self.blocked += 1
+            await self.release.wait()
+            self.blocked -= 1
+        self.sent[chat_id] += 1
+        return text
+
+
+@pytest.fixture
+def practice(db, monkeypatch):
+    """Ten users, a stubbed question generator and no wait between passes."""
+    for user_id in range(1, 11):
+        db.set_user_level(user_id, 'beginner' if user_id % 2 else 'advanced')
+    monkeypatch.setattr(daily_practice, 'generate_topic_question',
+                        lambda topic, level: f"AI: What do you like about {topic}?")
+    monkeypatch.setattr(daily_practice, 'PRACTICE_RETRY_DELAY_S', 0)
+    monkeypatch.setattr(daily_practice, 'PRACTICE_PAGE_SIZE', 4)
+    return db
+
+
+def context():
+    return types.SimpleNamespace(job=types.SimpleNamespace(data={'topics': TOPICS}))
+
+
+async def run_with(bot, monkeypatch, job=daily_practice.run_daily_practice):
+    dispatcher = OutboundDispatcher(global_rate=1000, chat_rate=1000, chat_burst=10)
+    monkeypatch.setattr(daily_practice, 'dispatcher', dispatcher)
+    await dispatcher.start(bot)
+    try:
+        await job(context())
+    finally:
+        await dispatcher.stop()
+
+
+def run_state(db):
+    with db.get_db() as conn:
+        status, delivered, finished_at = conn.execute(
+            'SELECT status, delivered, finished_at FROM practice_runs'
+        ).fetchone()
+        rows = dict(conn.execute('SELECT user_id, status FROM practice_deliveries').fetchall())
+    return status, delivered, finished_at, rows
+
+
+def test_run_without_failures_ends_done(practice, monkeypatch):
+    bot = FakeBot()
+    asyncio.run(run_with(bot, monkeypatch))
+
+    status, delivered, finished_at, rows = run_state(practice)
+    assert status == 'done' and finished_at is not None
+    assert delivered == 10
+    assert bot.sent == Counter(range(1, 11))
+    assert set(rows.values()) == {'sent'}
+    # The question is in the user's history so their reply has context
+    assert practice.get_conversation(3)[-1][0] == 'assistant'
+
+
+def test_resume_after_partial_run_sends_nothing_twice(practice, monkeypatch):
+    monkeypatch.setattr(daily_practice, 'PRACTICE_MAX_PASSES', 1)
+    first = FakeBot(fail={2: NetworkError("down"), 7: NetworkError("down")})
+    asyncio.run(run_with(first, monkeypatch))
+    status, delivered, _, rows = run_state(practice)
+    assert status == 'running'
+    assert delivered == 8 and 2 not in rows and 7 not in rows
+
+    second = FakeBot()
+    asyncio.run(run_with(second, monkeypatch, daily_practice.resume_daily_practice))
+    assert second.sent == Counter([2, 7])
+    assert first.sent + second.sent == Counter(range(1, 11))
+    assert run_state(practice)[0] == 'done'
+
+
+def test_dispatcher_stop_aborts_run_and_leaves_it_running(practice, monkeypatch):
+    bot = FakeBot(block_after=3)
+
+    async def scenario():
+        dispatcher = OutboundDispatcher(global_rate=1000, chat_rate=1000, chat_burst=10, max_in_flight=2)
+        monkeypatch.setattr(daily_practice, 'dispatcher', dispatcher)
+        await dispatcher.start(bot)
+        job = asyncio.create_task(daily_practice.run_daily_practice(context()))
+        while not bot.blocked:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop(timeout=0)
+        # Sends already in flight complete and must still be recorded
+        bot.release.set()
+        await asyncio.wait_for(job, 5)
+
+    asyncio.run(scenario())
+    status, delivered, _, rows = run_state(practice)
+    assert status == 'running'
+    assert 3 <= delivered < 10
+    assert set(rows) == set(bot.sent)
+
+    resumed = FakeBot()
+    asyncio.run(run_with(resumed, monkeypatch, daily_practice.resume_daily_practice))
+    assert bot.sent + resumed.sent == Counter(range(1, 11))
+    assert run_state(practice)[0] == 'done'
+
+
+def test_blocked_users_are_not_retried(practice, monkeypatch):
+    bot = FakeBot(fail={4: Forbidden("Forbidden: bot was blocked by the user")})
+    asyncio.run(run_with(bot, monkeypatch))
+
+    status, delivered, _, rows = run_state(practice)
+    assert status == 'done'
+    assert delivered == 9
+    assert rows[4] == 'failed'
+
+
+def test_opted_out_users_are_skipped(practice, monkeypatch):
+    daily_practice.set_practice_opt_out(5, True)
+    daily_practice.set_practice_opt_out(6, True)
+    daily_practice.set_practice_opt_out(6, False)
+    bot = FakeBot()
+    asyncio.run(run_with(bot, monkeypatch))
+
+    assert daily_practice.is_practice_opted_out(5)
+    assert bot.sent == Counter(set(range(1, 11)) - {5})
+    assert run_state(practice)[0] == 'done'
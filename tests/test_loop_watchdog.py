@@ -0,0 +1,38 @@
+import asyncio
+import json
+import time
+
+from loop_watchdog import LoopWatchdog
+
+
+def test_stalls_are_written_to_the_metrics_file(tmp_path):
+    metrics_file = tmp_path / 'metrics' / 'loop_metrics.json'
+    watchdog = LoopWatchdog(threshold_ms=50, interval_ms=10, report_interval_s=0.05, metrics_file=str(metrics_file))
+
+    async def blocking_handler():
+        time.sleep(0.2)
+
+    async def scenario():
+        watchdog.start()
+        await asyncio.sleep(0.05)
+        await blocking_handler()
+        await asyncio.sleep(0.1)
+        periodic = json.loads(metrics_file.read_text())
+        await watchdog.stop()
+        return periodic
+
+    periodic = asyncio.run(scenario())
+    assert periodic['stalls'] >= 1
+
+    final = json.loads(metrics_file.read_text())
+    assert final['stalls'] >= 1
+    assert final['lag_ms']['max'] >= 150
+    assert final['top_offenders'][0]['count'] >= 1
+    assert 'updated_at' in final
+
+
+def test_metrics_file_can_be_disabled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    watchdog = LoopWatchdog(metrics_file='')
+    watchdog.write_metrics()
+    assert list(tmp_path.iterdir()) == []
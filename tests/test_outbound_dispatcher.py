@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter
+
+from outbound_dispatcher import OutboundDispatcher, BACKGROUND, INTERACTIVE
+
+
+class FakeBot:
+    """Records send_message calls; optionally fails the first one with RetryAfter."""
+
+    def __init__(self, retry_after: int | None = None):
+        self.calls = []
+        self.retry_after = retry_after
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.retry_after is not None:
+            retry_after, self.retry_after = self.retry_after, None
+            raise RetryAfter(retry_after)
+        self.calls.append((time.monotonic(), chat_id, text))
+        return text
+
+
+async def _with_dispatcher(bot, body, **options):
+    dispatcher = OutboundDispatcher(**{'global_rate': 1000, 'chat_rate': 10, 'chat_burst': 2, **options})
+    await dispatcher.start(bot)
+    try:
+        return await body(dispatcher)
+    finally:
+        await dispatcher.stop()
+
+
+def test_sequential_sends_to_one_chat_are_rate_limited():
+    bot = FakeBot()
+
+    async def body(dispatcher):
+        start = time.monotonic()
+        for i in range(6):
+            await dispatcher.send_text(1, f"message {i}")
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(_with_dispatcher(bot, body))
+    # Burst of 2, then 4 more at 10/s
+    assert elapsed >= 0.35
+    assert [text for _, _, text in bot.calls] == [f"message {i}" for i in range(6)]
+
+
+def test_other_chats_are_not_slowed_by_a_busy_chat():
+    bot = FakeBot()
+
+    async def body(dispatcher):
+        for i in range(4):
+            await dispatcher.send_text(1, f"message {i}")
+        start = time.monotonic()
+        await dispatcher.send_text(2, "hello")
+        return time.monotonic() - start
+
+    assert asyncio.run(_with_dispatcher(bot, body)) < 0.05
+
+
+def test_retry_after_reschedules_instead_of_failing():
+    bot = FakeBot(retry_after=1)
+
+    async def body(dispatcher):
+        start = time.monotonic()
+        result = await dispatcher.send_text(1, "hello")
+        return result, time.monotonic() - start, dispatcher.stats
+
+    result, elapsed, stats = asyncio.run(_with_dispatcher(bot, body))
+    assert result == "hello"
+    assert elapsed >= 1
+    assert stats['retry_after'] == 1 and stats['failed'] == 0
+
+
+def test_adjacent_texts_are_merged_and_interactive_goes_first():
+    bot = FakeBot()
+
+    async def body(dispatcher):
+        # Use up the burst so the following messages queue up together
+        await dispatcher.send_text(1, "first")
+        await dispatcher.send_text(1, "second")
+        background = dispatcher.enqueue_text(1, "reminder", BACKGROUND)
+        replies = [dispatcher.enqueue_text(1, text, INTERACTIVE) for text in ("a", "b")]
+        await asyncio.gather(background, *replies)
+
+    asyncio.run(_with_dispatcher(bot, body))
+    assert [text for _, _, text in bot.calls] == ["first", "second", "a\n\nb", "reminder"]
+
+
+def test_cancelled_calls_are_not_sent():
+    bot = FakeBot()
+
+    async def body(dispatcher):
+        await dispatcher.send_text(1, "first")
+        await dispatcher.send_text(1, "second")
+        # The burst is used up, so these wait in the queue
+        cancelled = dispatcher.enqueue_text(1, "cancelled", BACKGROUND)
+        kept = dispatcher.enqueue_text(1, "kept", BACKGROUND)
+        cancelled.cancel()
+        await kept
+
+    asyncio.run(_with_dispatcher(bot, body))
+    assert [text for _, _, text in bot.calls] == ["first", "second", "kept"]
+
+
+class FailingBot:
+    async def send_message(self, chat_id, text, **kwargs):
+        raise ValueError("boom")
+
+
+def test_failures_are_logged_only_for_fire_and_forget_calls(caplog):
+    async def body(dispatcher):
+        try:
+            await dispatcher.send_text(1, "awaited")
+        except ValueError:
+            pass
+        future = dispatcher.enqueue_text(2, "fire and forget")
+        await asyncio.wait([future])
+        await asyncio.sleep(0)
+
+    with caplog.at_level(logging.ERROR, logger='outbound_dispatcher'):
+        asyncio.run(_with_dispatcher(FailingBot(), body))
+    assert [r.getMessage() for r in caplog.records if r.name == 'outbound_dispatcher'] == [
+        "Outbound message failed: boom"
+    ]
+
+
+def test_unmergeable_texts_are_sent_on_their_own():
+    bot = FakeBot()
+
+    async def body(dispatcher):
+        await dispatcher.send_text(1, "first")
+        await dispatcher.send_text(1, "second")
+        replies = [
+            dispatcher.enqueue_text(1, "reply"),
+            dispatcher.enqueue_text(1, "processing", merge=False),
+            dispatcher.enqueue_text(1, "next"),
+        ]
+        await asyncio.gather(*replies)
+
+    asyncio.run(_with_dispatcher(bot, body))
+    assert [text for _, _, text in bot.calls] == ["first", "second", "reply", "processing", "next"]
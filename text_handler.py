@@ -4,6 +4,7 @@ from openai import OpenAI, APIError
 import httpx
 from logger_config import setup_logger
 from utils import retry_on_timeout
+from prompts import render_prompt, record_usage
 
 # Load environment variables
 load_dotenv()
@@ -12,6 +13,9 @@ client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 # Setup logger
 logger = setup_logger('text_handler', 'text_handler.log')
 
+# Returned by generate_topic_question when the API call fails
+TOPIC_QUESTION_FALLBACK = "AI: I'm sorry, I couldn't generate a question. Let's just start chatting!"
+
 @retry_on_timeout(max_retries=3)
 def correct_text(text: str, level: str, conversation_history: list = None) -> str:
     """
@@ -28,31 +32,8 @@ def correct_text(text: str, level: str, conversation_history: list = None) -> st
         # Log the API request
         logger.info(f"Sending request to OpenAI API - level: {level}, history length: {len(conversation_history) if conversation_history else 0}")
 
-        # Create a prompt that encourages natural, conversational corrections
-        system_prompt = f"""You are a friendly English tutor having a conversation with a {level}-level English learner. 
-        When responding:
-        1. Reply naturally to keep the conversation flowing
-        2. Always include:
-           - A response to what they said
-           - A relevant follow-up question to keep the conversation going
-        3. If there are language mistakes:
-           - Identify what could be improved
-           - Suggest more natural alternatives
-           - Explain why the changes make it more natural (briefly)
-        4. Use common, everyday expressions appropriate for their {level} level
-        5. Match the formality level to the context
-        6. Only correct if the change helps them improve their English
-        7. Consider the conversation context when responding
-        
-        Format your response as:
-        AI: [your response to their message + a follow-up question]
-        
-        Corrected: [if needed, explain improvements and provide better alternatives]
-        Example correction format:
-        - Original: "I am very tired because I slept very late yesterday"
-        - Better: "I'm really tired because I went to bed late last night"
-        - Why: Using "I'm" is more natural in conversation, and "went to bed" is the common way to express sleeping time
-        """
+        # Level-independent instructions come first so the prompt prefix stays cacheable
+        system_prompt = render_prompt('conversation', level=level)
 
         # Start with the system message
         messages = [{"role": "system", "content": system_prompt}]
@@ -75,6 +56,7 @@ def correct_text(text: str, level: str, conversation_history: list = None) -> st
             timeout=30
         )
         logger.info("Received response from OpenAI API")
+        record_usage('conversation', response.usage)
 
         return response.choices[0].message.content
 
@@ -98,12 +80,7 @@ def generate_topic_question(topic: str, level: str) -> str:
     try:
         logger.info(f"Generating topic question - topic: {topic}, level: {level}")
         
-        system_prompt = f"""You are a friendly English tutor starting a conversation about {topic} with a {level}-level English learner.
-        Generate an engaging, level-appropriate question to start the conversation.
-        Make it natural and conversational, as if you're chatting with a friend.
-        
-        Format your response as:
-        AI: [your conversation-starting question]"""
+        system_prompt = render_prompt('topic_question', topic=topic, level=level)
 
         conversation = [
             {"role": "system", "content": system_prompt},
@@ -117,9 +94,10 @@ def generate_topic_question(topic: str, level: str) -> str:
             max_tokens=150
         )
         logger.info("Received topic question from OpenAI API")
+        record_usage('topic_question', response.usage)
         
         return response.choices[0].message.content
         
     except Exception as e:
         logger.error(f"Error generating topic question: {str(e)}")
-        return "AI: I'm sorry, I couldn't generate a question. Let's just start chatting!"
\ No newline at end of file
+        return TOPIC_QUESTION_FALLBACK
\ No newline at end of file